@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter, defaultdict
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from duplicate_finder.engine import ScanEngine
+from duplicate_finder.grouping import DEFAULT_THRESHOLD, MAX_THRESHOLD
+from duplicate_finder.hashing import default_workers
+from duplicate_finder.prefetch import DEFAULT_IO_WORKERS
+
+
+# Bump when the generator changes, so stale corpora are rebuilt
+CORPUS_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+
+ORIGINAL_SIZE = (640, 480)
+
+# Variant kinds and the share of originals that get each one
+VARIANTS = {
+    'copy': 0.2,
+    'resized': 0.2,
+    'recompressed': 0.2,
+    'cropped': 0.1,
+    'rotated': 0.1,
+    'jpeg2000': 0.02,
+}
+
+# JPEG 2000 variants are blown up to an odd size beyond 4096 px and encoded
+# lossily with fewer resolution levels than that size calls for, which is
+# where reduced decoding has to stop early
+JPEG2000_SIZE = (5461, 4097)
+JPEG2000_OPTIONS = {'num_resolutions': 4, 'quality_mode': 'rates', 'quality_layers': [40]}
+
+
+def make_original(rng):
+    # Smooth random field with a few shapes on top: distinct images get
+    # unrelated low-frequency structure, which is what pHash looks at
+    field = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    img = Image.fromarray(field, 'RGB').resize(ORIGINAL_SIZE, Image.Resampling.BICUBIC)
+    draw = ImageDraw.Draw(img)
+    width, height = ORIGINAL_SIZE
+    for _ in range(rng.integers(3, 8)):
+        x0, y0 = int(rng.integers(0, width - 40)), int(rng.integers(0, height - 40))
+        x1 = x0 + int(rng.integers(20, width // 2))
+        y1 = y0 + int(rng.integers(20, height // 2))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+    return img
+
+
+def make_variant(img, kind, rng):
+    width, height = img.size
+    if kind == 'resized':
+        scale = rng.uniform(0.3, 0.8)
+        return img.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    if kind == 'cropped':
+        # Trim up to 5% off each edge
+        dx, dy = int(width * 0.05), int(height * 0.05)
+        box = (
+            int(rng.integers(0, dx + 1)), int(rng.integers(0, dy + 1)),
+            width - int(rng.integers(0, dx + 1)), height - int(rng.integers(0, dy + 1)),
+        )
+        return img.crop(box)
+    if kind == 'rotated':
+        return img.rotate(float(rng.uniform(-3, 3)), resample=Image.Resampling.BICUBIC)
+    if kind == 'jpeg2000':
+        return img.resize(JPEG2000_SIZE, Image.Resampling.BICUBIC)
+    return img
+
+
+def generate_corpus(directory, count, seed):
+    # Writes `count` unrelated originals plus variants of some of them, and a
+    # manifest mapping each file to the original it derives from
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(directory, 'originals'), exist_ok=True)
+    os.makedirs(os.path.join(directory, 'variants'), exist_ok=True)
+
+    files = {}
+    for n in range(count):
+        img = make_original(rng)
+        ext = '.jpg' if n % 2 == 0 else '.png'
+        name = os.path.join('originals', f"{n:06d}{ext}")
+        img.save(os.path.join(directory, name), quality=90)
+        files[name] = {'source': n, 'kind': 'original'}
+
+        for kind, share in VARIANTS.items():
+            if rng.random() >= share:
+                continue
+            variant_ext = {'copy': ext, 'jpeg2000': '.jp2'}.get(kind, '.jpg')
+            variant = os.path.join('variants', f"{n:06d}_{kind}{variant_ext}")
+            if kind == 'copy':
+                shutil.copyfile(os.path.join(directory, name), os.path.join(directory, variant))
+            elif kind == 'jpeg2000':
+                make_variant(img, kind, rng).save(os.path.join(directory, variant), **JPEG2000_OPTIONS)
+            else:
+                quality = int(rng.integers(40, 70)) if kind == 'recompressed' else 90
+                make_variant(img, kind, rng).save(os.path.join(directory, variant), quality=quality)
+            files[variant] = {'source': n, 'kind': kind}
+
+    manifest = {'version': CORPUS_VERSION, 'count': count, 'seed': seed, 'files': files}
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_corpus(directory, count, seed):
+    # Reuse a corpus generated earlier with the same parameters. A folder is
+    # only cleared when its manifest shows this script made it; any other
+    # folder has to be empty or not exist yet, so no photos are ever deleted.
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+        key = (manifest['version'], manifest['count'], manifest['seed'])
+        if not isinstance(manifest['files'], dict):
+            raise ValueError("not a corpus manifest")
+    except (OSError, ValueError, KeyError, TypeError):
+        if os.path.isdir(directory) and os.listdir(directory):
+            raise ValueError(
+                f"{directory} is not empty and holds no benchmark corpus; pick a new or empty folder"
+            )
+    else:
+        if key == (CORPUS_VERSION, count, seed):
+            return manifest
+        shutil.rmtree(directory)
+    return generate_corpus(directory, count, seed)
+
+
+def pairs(n):
+    return n * (n - 1) // 2
+
+
+def score(groups, manifest, directory):
+    # Pairwise precision/recall of the found groups against the ground truth,
+    # plus per-variant recall (variant grouped together with its original)
+    truth = {os.path.join(directory, name): info for name, info in manifest['files'].items()}
+    true_pairs = sum(pairs(n) for n in Counter(info['source'] for info in truth.values()).values())
+
+    found_pairs = correct_pairs = 0
+    group_of = {}
+    for g, grp in enumerate(groups):
+        found_pairs += pairs(len(grp))
+        correct_pairs += sum(pairs(n) for n in Counter(truth[path]['source'] for path in grp).values())
+        for path in grp:
+            group_of[path] = g
+
+    originals = {info['source']: path for path, info in truth.items() if info['kind'] == 'original'}
+    recall_by_kind = defaultdict(lambda: [0, 0])
+    for path, info in truth.items():
+        if info['kind'] == 'original':
+            continue
+        hit = recall_by_kind[info['kind']]
+        hit[1] += 1
+        if path in group_of and group_of[path] == group_of.get(originals[info['source']]):
+            hit[0] += 1
+
+    return {
+        'true_pairs': true_pairs,
+        'found_pairs': found_pairs,
+        'precision': round(correct_pairs / found_pairs, 4) if found_pairs else None,
+        'recall': round(correct_pairs / true_pairs, 4) if true_pairs else None,
+        'recall_by_variant': {
+            kind: round(found / total, 4) for kind, (found, total) in sorted(recall_by_kind.items())
+        },
+    }
+
+
+def run_scan(directory, workers, io_workers, threshold, scratch):
+    engine = ScanEngine(
+        [directory],
+        workers=workers,
+        io_workers=io_workers,
+        threshold=threshold,
+        cache_path=os.path.join(scratch, "hash_cache.sqlite3"),
+        report_path=os.path.join(scratch, "scan_report.json"),
+        results_path=os.path.join(scratch, "scan_results.sqlite3")
+    )
+    for _ in engine.scan():
+        pass
+    report = engine.stats.report()
+    return engine.duplicate_groups, {
+        'elapsed_seconds': report['elapsed_seconds'],
+        'files_per_sec': report['files_per_sec'],
+        'counts': report['counts'],
+        'stages': report['stages'],
+        'peak_rss_bytes': report['peak_rss_bytes'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic duplicate corpus, scan it and score the results."
+    )
+    parser.add_argument("--images", type=int, default=500, help="unrelated originals (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="corpus seed (default: %(default)s)")
+    parser.add_argument(
+        "--corpus", default=os.path.join(tempfile.gettempdir(), "duplicate_finder_bench"),
+        help="corpus folder, reused while --images and --seed match (default: %(default)s)"
+    )
+    parser.add_argument("--workers", type=int, default=default_workers(), help="hashing processes (default: %(default)s)")
+    parser.add_argument(
+        "--io-workers", type=int, default=DEFAULT_IO_WORKERS, help="read-ahead threads (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--threshold", type=int, default=DEFAULT_THRESHOLD,
+        choices=range(0, MAX_THRESHOLD + 1), metavar=f"0-{MAX_THRESHOLD}",
+        help="match threshold (default: %(default)s)"
+    )
+    parser.add_argument("--warm", action="store_true", help="scan a second time with the hash cache filled")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    corpus = os.path.abspath(args.corpus)
+    try:
+        manifest = load_corpus(corpus, args.images, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Cache, report and results live outside the corpus so they are never scanned
+    with tempfile.TemporaryDirectory() as scratch:
+        groups, cold = run_scan(corpus, args.workers, args.io_workers, args.threshold, scratch)
+        results = {
+            'corpus': {'images': args.images, 'seed': args.seed, 'files': len(manifest['files'])},
+            'workers': args.workers,
+            'io_workers': args.io_workers,
+            'threshold': args.threshold,
+            'cold': cold,
+            'accuracy': score(groups, manifest, corpus),
+        }
+        if args.warm:
+            results['warm'] = run_scan(corpus, args.workers, args.io_workers, args.threshold, scratch)[1]
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import signal
+import sys
+
+from duplicate_finder.engine import POLL_INTERVAL, ScanEngine, unique_roots
+from duplicate_finder.grouping import DEFAULT_THRESHOLD, MAX_THRESHOLD
+from duplicate_finder.hash_cache import default_cache_path
+from duplicate_finder.hashing import default_workers
+from duplicate_finder.prefetch import DEFAULT_IO_WORKERS
+from duplicate_finder.results import EXPORT_FORMATS, ResultStore, default_results_path
+from duplicate_finder.shards import Shard, default_node, merge_shards, write_shard
+from duplicate_finder.stats import default_report_path
+
+
+def _folder(path):
+    # A mistyped or unmounted root would otherwise scan as an empty folder
+    if not os.path.isdir(path):
+        raise argparse.ArgumentTypeError(f"not a folder: {path}")
+    return path
+
+
+def _emit(event, out):
+    out.write(json.dumps(event) + "\n")
+    out.flush()
+
+
+def _stream(engine, events, out, progress=False):
+    # Ctrl+C stops the scan cleanly, leaving a checkpoint the next run resumes
+    # from; in watch mode it ends the watch
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: engine.cancel())
+    status = 0
+    try:
+        for event in events:
+            if event['event'] == 'cancelled':
+                status = 130
+            if event['event'] == 'progress' and not progress:
+                continue
+            _emit(event, out)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    return status
+
+
+def _with_shard(engine, events, path, node):
+    # The shard is written as soon as the scan is done, so it holds the scan
+    # itself; with --watch, later changes only reach the live index
+    for event in events:
+        yield event
+        if event['event'] == 'done':
+            write_shard(engine, path, node)
+            yield {'event': 'shard', 'path': path, 'node': node, 'files': len(engine.files)}
+
+
+def cmd_scan(args, out):
+    engine = ScanEngine(
+        args.roots,
+        workers=args.workers,
+        threshold=args.threshold,
+        use_exif_thumbnails=args.exif_thumbnails,
+        cache_path=args.cache,
+        report_path=args.report,
+        io_workers=args.io_workers,
+        resume=not args.no_resume,
+        results_path=args.results
+    )
+    events = engine.watch(args.poll_interval) if args.watch else engine.scan()
+    if args.shard:
+        events = _with_shard(engine, events, args.shard, args.node)
+    return _stream(engine, events, out, args.progress)
+
+
+def cmd_reopen(args, out):
+    engine = ScanEngine(
+        args.roots,
+        workers=args.workers,
+        cache_path=args.cache,
+        results_path=args.results
+    )
+    events = engine.watch(args.poll_interval, reopen=True, run=args.run) if args.watch else engine.reopen(args.run)
+    try:
+        return _stream(engine, events, out)
+    except ValueError as e:
+        _emit({'event': 'error', 'error': str(e)}, out)
+        return 1
+
+
+def cmd_export(args, out):
+    store = ResultStore(args.results)
+    try:
+        store.find_run(unique_roots(args.roots), args.run)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                store.export(f, args.format)
+        else:
+            store.export(out, args.format)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_merge(args, out):
+    try:
+        shards = [Shard(path) for path in args.shards]
+        groups, matches = merge_shards(shards, args.threshold)
+    except (OSError, ValueError) as e:
+        _emit({'event': 'error', 'error': str(e)}, out)
+        return 1
+    for grp, match in zip(groups, matches):
+        _emit({
+            'event': 'group',
+            'match': match,
+            'nodes': [node for node, _ in grp],
+            'paths': [path for _, path in grp],
+        }, out)
+    _emit({
+        'event': 'done',
+        'shards': len(shards),
+        'files': sum(len(shard) for shard in shards),
+        'groups': len(groups),
+    }, out)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="duplicate_finder",
+        description="Find duplicate images without the GUI. Results are written as JSON lines."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser(
+        "scan",
+        help="scan folders and stream file_hashed / error / group events"
+    )
+    scan.add_argument("roots", nargs="+", type=_folder, help="folders to scan")
+    scan.add_argument(
+        "--workers", type=int, default=default_workers(),
+        help="hashing processes (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--io-workers", type=int, default=DEFAULT_IO_WORKERS,
+        help="threads reading files ahead of the hashing processes, 0 to disable (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--threshold", type=int, default=DEFAULT_THRESHOLD,
+        choices=range(0, MAX_THRESHOLD + 1), metavar=f"0-{MAX_THRESHOLD}",
+        help="max differing hash bits for a match (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--cache", default=default_cache_path(),
+        help="hash cache database (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--report", default=default_report_path(),
+        help="JSON file for stage timings and throughput (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--results", default=default_results_path(),
+        help="result store the groups are saved to, for reopen and export (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--exif-thumbnails", action="store_true",
+        help="hash JPEG EXIF thumbnails when present"
+    )
+    scan.add_argument(
+        "--no-resume", action="store_true",
+        help="start over instead of resuming an interrupted scan of the same folders"
+    )
+    scan.add_argument(
+        "--shard",
+        help="also save the scan as an index shard file for the merge command (with --watch, before watching starts)"
+    )
+    scan.add_argument(
+        "--node", default=default_node(),
+        help="machine name recorded in the shard (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--watch", action="store_true",
+        help="after the scan, keep watching the folders and stream group_update events until Ctrl+C"
+    )
+    scan.add_argument(
+        "--poll-interval", type=float, default=POLL_INTERVAL,
+        help="seconds between folder checks in --watch mode where inotify is unavailable (default: %(default)s)"
+    )
+    scan.add_argument(
+        "--progress", action="store_true",
+        help="also emit progress events"
+    )
+    scan.set_defaults(func=cmd_scan)
+
+    reopen = commands.add_parser(
+        "reopen",
+        help="stream the saved groups of an earlier scan, re-checking only files changed since"
+    )
+    reopen.add_argument(
+        "roots", nargs="*",
+        help="folders of the scan to reopen (default: the latest scan of any folders)"
+    )
+    reopen.add_argument("--run", type=int, help="id of the result set to reopen, from a done event")
+    reopen.add_argument(
+        "--results", default=default_results_path(),
+        help="result store (default: %(default)s)"
+    )
+    reopen.add_argument(
+        "--cache", default=default_cache_path(),
+        help="hash cache database (default: %(default)s)"
+    )
+    reopen.add_argument(
+        "--workers", type=int, default=default_workers(),
+        help="hashing processes for changed files (default: %(default)s)"
+    )
+    reopen.add_argument(
+        "--watch", action="store_true",
+        help="afterwards, keep watching the folders and stream group_update events until Ctrl+C"
+    )
+    reopen.add_argument(
+        "--poll-interval", type=float, default=POLL_INTERVAL,
+        help="seconds between folder checks in --watch mode where inotify is unavailable (default: %(default)s)"
+    )
+    reopen.set_defaults(func=cmd_reopen)
+
+    export = commands.add_parser(
+        "export",
+        help="write the saved groups of an earlier scan as JSON lines or CSV"
+    )
+    export.add_argument(
+        "roots", nargs="*",
+        help="folders of the scan to export (default: the latest scan of any folders)"
+    )
+    export.add_argument("--run", type=int, help="id of the result set to export, from a done event")
+    export.add_argument(
+        "--results", default=default_results_path(),
+        help="result store (default: %(default)s)"
+    )
+    export.add_argument(
+        "--format", choices=EXPORT_FORMATS, default=EXPORT_FORMATS[0],
+        help="jsonl: one object per group; csv: one row per file (default: %(default)s)"
+    )
+    export.add_argument("--output", help="file to write instead of stdout")
+    export.set_defaults(func=cmd_export)
+
+    merge = commands.add_parser(
+        "merge",
+        help="find duplicate groups across shard files written by scan --shard"
+    )
+    merge.add_argument("shards", nargs="+", help="shard files to combine")
+    merge.add_argument(
+        "--threshold", type=int, default=DEFAULT_THRESHOLD,
+        choices=range(0, MAX_THRESHOLD + 1), metavar=f"0-{MAX_THRESHOLD}",
+        help="max differing hash bits for a match (default: %(default)s)"
+    )
+    merge.set_defaults(func=cmd_merge)
+    return parser
+
+
+def main(argv=None, out=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args, out or sys.stdout)
@@ -0,0 +1,741 @@
+import os
+import queue
+import threading
+import time
+from array import array
+from itertools import chain
+
+from duplicate_finder.exact import SizeFilter, find_exact_groups
+from duplicate_finder.formats import ALL_IMAGE_EXTS, JPEG_EXTS, RAW_EXTS
+from duplicate_finder.grouping import DEFAULT_THRESHOLD, merge_exact_groups
+from duplicate_finder.hash_cache import HashCache
+from duplicate_finder.hash_index import FileList, FileStat, HashIndex, PathSet, PathTable
+from duplicate_finder.hashing import CHUNK_SIZE, cache_column, iter_hashes, parse_hashes
+from duplicate_finder.live import LiveIndex
+from duplicate_finder.prefetch import DEFAULT_IO_WORKERS, prefetch
+from duplicate_finder.results import ResultStore, default_results_path
+from duplicate_finder.stats import ScanStats, default_report_path
+from duplicate_finder.walker import walk_images
+from duplicate_finder.watcher import Changes, InotifyWatcher, PollingWatcher
+
+
+# Files the directory walk may run ahead of the hash stage
+WALK_QUEUE_SIZE = 10000
+
+# Minimum seconds between progress events
+PROGRESS_INTERVAL = 0.1
+
+# Events buffered inside the walk/lookup stage before they are handed out
+EVENT_FLUSH = 256
+
+# The work list and pending hashes are checkpointed after this many newly
+# found or hashed files, or this many seconds, whichever comes first
+CHECKPOINT_FILES = 1000
+CHECKPOINT_SECONDS = 30.0
+
+# Bytes prefetched from files whose decoders only read the start: JPEGs
+# hashed from their EXIF thumbnail, and RAW files, whose embedded preview
+# usually sits near the start of the file
+EXIF_HEAD_BYTES = 256 * 1024
+RAW_HEAD_BYTES = 4 * 1024 * 1024
+
+# Watch mode: seconds between checks for cancel() while idle, and between
+# full tree comparisons when inotify is not available
+WATCH_TIMEOUT = 1.0
+POLL_INTERVAL = 10.0
+
+
+def unique_roots(roots):
+    # Absolute, sorted roots without repeats or roots nested inside another,
+    # so no file is scanned twice; also the key of checkpoints and results
+    if isinstance(roots, str):
+        roots = [roots]
+    kept = []
+    for root in sorted({os.path.abspath(root) for root in roots}):
+        if not any(root.startswith(os.path.join(other, '')) for other in kept):
+            kept.append(root)
+    return kept
+
+
+class ScanEngine:
+    # Headless duplicate scan over one or more root folders. scan() is a
+    # generator of event dicts, each with an "event" key:
+    #   resumed      files, walk_done (work list taken over from an interrupted scan)
+    #   progress     hashed, found, walk_done
+    #   file_hashed  path, hash (None for exact copies), cached, copy_of
+    #   error        path, error
+    #   group        group (id), match ("exact" or "perceptual"), paths,
+    #                sizes, dimensions ([width, height] or None per path),
+    #                reclaimable (bytes freed by keeping only the first path)
+    #   done         files, groups, report (path of the JSON scan report),
+    #                results (path of the result store), run (result set id)
+    #   cancelled    files, hashed (instead of group/done events)
+    # Once scan() is exhausted, duplicate_groups and group_matches hold the
+    # results and stats the timings that were written to the report; files,
+    # index and exact_groups keep the raw scan state (see shards.py).
+    # Files and groups are also saved to the result store as the scan goes,
+    # so reopen() can bring them back later without scanning.
+    # cancel() may be called from any thread; the scan then stops soon after,
+    # leaving a checkpoint that the next scan of the same roots resumes from.
+
+    def __init__(self, roots, workers=None, threshold=DEFAULT_THRESHOLD,
+                 use_exif_thumbnails=False, cache_path=None, report_path=None,
+                 io_workers=DEFAULT_IO_WORKERS, resume=True, checkpoint_files=CHECKPOINT_FILES,
+                 checkpoint_seconds=CHECKPOINT_SECONDS, results_path=None):
+        self.roots = unique_roots(roots)
+        self.workers = workers
+        self.io_workers = io_workers
+        self.threshold = threshold
+        self.use_exif_thumbnails = use_exif_thumbnails
+        self.cache_path = cache_path
+        self.report_path = report_path or default_report_path()
+        self.results_path = results_path or default_results_path()
+        self.resume = resume
+        self.checkpoint_files = checkpoint_files
+        self.checkpoint_seconds = checkpoint_seconds
+        self.stop = threading.Event()
+
+        self.files = FileList()
+        self.index = HashIndex(self.files.paths)
+        self.exact_groups = []
+        self.duplicate_groups = []
+        self.group_matches = []
+        self.stats = ScanStats()
+        self.run = None
+        self.live = None
+        # Directories the last walk could not list, roots included
+        self.unlisted = set()
+
+
+    def cancel(self):
+        self.stop.set()
+
+
+    def _put(self, found, item):
+        # Blocking put that gives up once the scan is cancelled
+        while not self.stop.is_set():
+            try:
+                found.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _read_limit(self, path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext in RAW_EXTS:
+            return RAW_HEAD_BYTES
+        if self.use_exif_thumbnails and ext in JPEG_EXTS:
+            return EXIF_HEAD_BYTES
+        return None
+
+
+    def _resumed_items(self, paths):
+        # Files from a checkpointed work list, stat'ed again; ones that have
+        # since disappeared are dropped
+        for path in paths:
+            try:
+                yield path, os.stat(path), None
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                yield path, None, str(e)
+
+
+    def _check_roots(self, unlisted):
+        # (root, None, error message) for every root that cannot be listed,
+        # e.g. an unmounted share or a moved folder; those are added to
+        # `unlisted`, so their files are kept rather than taken for deleted
+        for root in self.roots:
+            try:
+                os.scandir(root).close()
+            except OSError as e:
+                unlisted.add(root)
+                yield root, None, str(e)
+
+
+    def _walk_thread(self, found, resumed, walk_done):
+        # Producer: feeds (path, stat, error) tuples to the scan, then None.
+        # Files of a resumed work list come first; the walk is skipped when it
+        # had already finished, and otherwise passes over the files already listed.
+        # Time spent blocked on the full queue is not counted as walk time.
+        blocked = 0.0
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            unlisted = self.unlisted
+            items = chain(self._check_roots(unlisted), self._resumed_items(resumed))
+            if not walk_done:
+                known = PathSet(resumed)
+                walked = (
+                    item
+                    for root in self.roots if root not in unlisted
+                    for item in walk_images(root, ALL_IMAGE_EXTS, unlisted)
+                    if item[0] not in known
+                )
+                items = chain(items, walked)
+            for item in items:
+                start = time.perf_counter()
+                if not self._put(found, item):
+                    break
+                blocked += time.perf_counter() - start
+        finally:
+            self.stats.add_stage('walk', time.perf_counter() - wall - blocked, time.thread_time() - cpu)
+            self._put(found, None)
+
+
+    def scan(self):
+        # Open the hash cache and result store here; sqlite connections belong
+        # to the thread that made them
+        cache = HashCache(self.cache_path)
+        store = ResultStore(self.results_path)
+        self.run = store.start_run(self.roots, self.threshold, self.use_exif_thumbnails)
+        self.unlisted = set()
+
+        # Take over the work list of an interrupted scan of the same roots
+        resumed, resumed_walk_done = PathTable(), False
+        checkpoint = cache.load_checkpoint(self.roots) if self.resume else None
+        if checkpoint is not None:
+            paths, resumed_walk_done = checkpoint
+            for path in paths:
+                resumed.append(path)
+            yield {'event': 'resumed', 'files': len(resumed), 'walk_done': resumed_walk_done}
+
+        # The directory walk runs alongside hashing; the bounded queue keeps it
+        # from racing ahead of the hash stage
+        found = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+        walker = threading.Thread(
+            target=self._walk_thread,
+            args=(found, resumed, resumed_walk_done),
+            daemon=True
+        )
+        walker.start()
+
+        # Scan state lives in compact arrays rather than per-file Python objects
+        files = self.files
+        stats = self.stats
+        index = self.index
+        sizes = SizeFilter()
+        deferred = array('q')
+        exact_groups = self.exact_groups
+        events = []
+        hashed = 0
+        walk_done = False
+        last_progress = 0.0
+        saved_files = saved_hashed = 0
+        last_checkpoint = time.monotonic()
+
+        def progress(force=False):
+            # Files found and files hashed are reported separately, since the
+            # total is unknown until the walk finishes
+            nonlocal last_progress
+            now = time.monotonic()
+            if force or now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                events.append({
+                    'event': 'progress',
+                    'hashed': hashed,
+                    'found': len(files),
+                    'walk_done': walk_done,
+                })
+
+        def save_checkpoint(force=False):
+            # Commit pending hashes and the files found so far, so an
+            # interrupted scan can pick up from here
+            nonlocal saved_files, saved_hashed, last_checkpoint
+            now = time.monotonic()
+            due = (
+                len(files) - saved_files + hashed - saved_hashed >= self.checkpoint_files
+                or now - last_checkpoint >= self.checkpoint_seconds
+            )
+            if force or due:
+                with stats.stage('cache'):
+                    new_paths = (files.paths[i] for i in range(saved_files, len(files)))
+                    cache.save_checkpoint(self.roots, saved_files, new_paths, walk_done)
+                with stats.stage('results'):
+                    store.commit()
+                saved_files, saved_hashed, last_checkpoint = len(files), hashed, now
+
+        def finish(file_id, h, error, cached=False, copy_of=None):
+            nonlocal hashed
+            path = files.paths[file_id]
+            with stats.stage('results'):
+                store.add_file(path, files.stat(file_id), h, copy_of, error)
+            if error is not None:
+                stats.count('errors')
+                events.append({'event': 'error', 'path': path, 'error': error})
+            else:
+                stats.count('cached' if cached else 'exact_copies' if copy_of else 'hashed')
+                if h is not None:
+                    index.add(file_id, h)
+                events.append({
+                    'event': 'file_hashed',
+                    'path': path,
+                    'hash': h,
+                    'cached': cached,
+                    'copy_of': copy_of,
+                })
+            hashed += 1
+            progress()
+
+        def cached(file_id):
+            # Unchanged files only cost a cache lookup
+            path = files.paths[file_id]
+            column = cache_column(path, self.use_exif_thumbnails)
+            with stats.stage('cache'):
+                h = cache.lookup(path, files.stat(file_id), column)
+            if h is not None:
+                finish(file_id, h, None, cached=True)
+            return h is not None
+
+        def pending():
+            # Files that still need hashing, as the walk finds them. Runs on
+            # the scanning thread, pulled along by the hash stage.
+            nonlocal walk_done
+            while not self.stop.is_set():
+                try:
+                    item = found.get(timeout=0.1)
+                except queue.Empty:
+                    # Let the hash stage flush its partial chunk while the walk is slow
+                    yield None
+                    continue
+                if item is None:
+                    break
+
+                path, st, error = item
+                if error is not None:
+                    stats.count('errors')
+                    store.add_file(path, None, error=error)
+                    events.append({'event': 'error', 'path': path, 'error': error})
+                    continue
+                file_id = files.append(path, st)
+                stats.count('files')
+                progress()
+                if len(events) >= EVENT_FLUSH:
+                    # Mostly cache hits; let the consumer see them without waiting for a hash
+                    yield None
+
+                # A file whose size has not come up yet cannot be a copy of an earlier
+                # one; the others wait for the exact-copy pass at the end of the walk
+                if st.st_size > 0 and sizes.seen_before(st.st_size):
+                    deferred.append(file_id)
+                elif not cached(file_id):
+                    yield file_id, path
+            else:
+                # Cancelled mid-walk
+                return
+
+            walk_done = True
+            progress(force=True)
+            save_checkpoint(force=True)
+
+            # Byte-identical copies are grouped by size and content digest without
+            # decoding; only one file of each exact group is perceptually hashed
+            waiting = set(deferred)
+            with stats.stage('exact'):
+                found_groups = find_exact_groups(files, cache)
+            for grp in found_groups:
+                # Prefer a file that has already been hashed as the group's representative
+                rep = next((i for i in grp if i not in waiting), grp[0])
+                exact_groups.append([rep] + [i for i in grp if i != rep])
+            copy_of = {i: grp[0] for grp in exact_groups for i in grp[1:]}
+
+            for file_id in deferred:
+                if self.stop.is_set():
+                    return
+                if file_id in copy_of:
+                    finish(file_id, None, None, copy_of=files.paths[copy_of[file_id]])
+                elif not cached(file_id):
+                    yield file_id, files.paths[file_id]
+                if len(events) >= EVENT_FLUSH:
+                    yield None
+
+        try:
+            # Files waiting to be decoded are read ahead in on-disk order on
+            # their own threads, so disk waits overlap with decoding
+            prefetched = prefetch(
+                pending(),
+                io_workers=self.io_workers,
+                locality=lambda file_id: files.inodes[file_id],
+                read_limit=self._read_limit,
+                stats=stats
+            )
+            results = iter_hashes(
+                prefetched,
+                workers=self.workers,
+                use_exif_thumbnails=self.use_exif_thumbnails
+            )
+            for result in results:
+                if self.stop.is_set():
+                    break
+                if result is not None:
+                    file_id, path, h, error, timing, size = result
+                    stats.record_file(path, files.sizes[file_id], timing)
+                    if error is None:
+                        column = cache_column(path, self.use_exif_thumbnails)
+                        with stats.stage('cache'):
+                            cache.store(path, files.stat(file_id), h, column)
+                            cache.store(path, files.stat(file_id), f"{size[0]}x{size[1]}", 'dimensions')
+                    finish(file_id, h, error)
+                save_checkpoint()
+                # Hand events over as they happen rather than at the end
+                yield from events
+                events.clear()
+
+            # Decided once: the work list is only complete if nothing was cut short
+            cancelled = self.stop.is_set()
+            if cancelled:
+                # Stop the hash stage now rather than letting it drain
+                results.close()
+                save_checkpoint(force=True)
+            else:
+                cache.clear_checkpoint(self.roots)
+                # Forget files that have disappeared since the last scan, but
+                # not the ones in folders that could not be looked into
+                with stats.stage('cache'):
+                    seen = PathSet(files.paths)
+                    for root in self.roots:
+                        if root not in self.unlisted:
+                            cache.evict_missing(root, seen, self.unlisted)
+        except BaseException:
+            cache.close()
+            store.close()
+            raise
+        progress(force=True)
+        yield from events
+        events.clear()
+
+        if cancelled:
+            cache.close()
+            store.finish('cancelled')
+            store.close()
+            stats.finish()
+            stats.write(self.report_path)
+            yield {'event': 'cancelled', 'files': len(files), 'hashed': hashed}
+            return
+
+        # Retreive groups with more than one image; near-identical hashes are grouped too
+        with stats.stage('group'):
+            groups, self.group_matches = merge_exact_groups(index.groups(self.threshold), exact_groups)
+        self.duplicate_groups = [[files.paths[i] for i in grp] for grp in groups]
+        # Exact copies were never hashed; they have the dimensions of the file they copy
+        rep_of = {i: grp[0] for grp in exact_groups for i in grp[1:]}
+        try:
+            for gid, (grp, match) in enumerate(zip(groups, self.group_matches)):
+                paths = self.duplicate_groups[gid]
+                with stats.stage('results'):
+                    sources = (rep_of.get(i, i) for i in grp)
+                    dimensions = self._dimensions(cache, ((files.paths[i], files.stat(i)) for i in sources))
+                    details = store.set_group(gid, match, paths, dimensions)
+                yield {'event': 'group', 'group': gid, 'match': match, 'paths': paths, **details}
+            with stats.stage('results'):
+                # Without all of its roots the scan does not replace the saved results
+                store.finish('incomplete' if self.unlisted.intersection(self.roots) else 'done')
+        finally:
+            cache.close()
+            store.close()
+
+        stats.finish()
+        stats.write(self.report_path)
+        yield {
+            'event': 'done',
+            'files': len(files),
+            'groups': len(self.duplicate_groups),
+            'report': self.report_path,
+            'results': self.results_path,
+            'run': self.run,
+        }
+
+
+    def reopen(self, run=None):
+        # Bring back saved results instead of scanning: result set `run`, or
+        # the latest finished scan of the roots (of any roots when the engine
+        # was given none). The saved groups come out right away as "group"
+        # events; then every saved file is stat'ed, and only files changed or
+        # gone since are re-hashed or dropped, exactly as in watch mode. Events:
+        #   reopened      run, roots, finished (time the scan ended), files, groups
+        #   group         as from scan(), for every saved group
+        #   file_hashed / file_removed / error / group_update   for changed files
+        #   revalidated   changed, removed (file counts)
+        #   done          files, groups, results, run
+        # The engine takes over the roots, threshold and EXIF thumbnail mode
+        # of the saved scan. Raises ValueError when there is nothing to reopen.
+        store = ResultStore(self.results_path)
+        cache = HashCache(self.cache_path)
+        try:
+            saved = store.find_run(self.roots, run)
+            self.run = saved['run']
+            self.roots = saved['roots']
+            self.threshold = saved['threshold']
+            self.use_exif_thumbnails = saved['use_exif_thumbnails']
+
+            files = {path: (st, hashes, copy_of) for path, st, hashes, copy_of in store.files()}
+            yield {
+                'event': 'reopened',
+                'run': self.run,
+                'roots': self.roots,
+                'finished': saved['finished'],
+                'files': len(files),
+                'groups': store.group_count(),
+            }
+            groups, matches = [], {}
+            for gid, match, paths, details in store.groups():
+                groups.append((gid, paths))
+                matches[gid] = match
+                yield {'event': 'group', 'group': gid, 'match': match, 'paths': paths, **details}
+
+            def values():
+                for path, (st, hashes, copy_of) in files.items():
+                    if copy_of is not None:
+                        hashes = files.get(copy_of, (None, None))[1]
+                    if hashes is not None:
+                        yield path, st, parse_hashes(hashes)['phash']
+
+            live = LiveIndex.from_groups(self.threshold, values(), groups, capacity=len(files))
+            # Exact copies of files that could not be decoded have no pHash and
+            # are not in the live index; their groups stay as saved
+            fixed = {gid: paths for gid, paths in groups if gid not in live.groups}
+
+            # Files under a root that cannot be listed are left as saved
+            unlisted = set()
+            for root, _, error in self._check_roots(unlisted):
+                yield {'event': 'error', 'path': root, 'error': error}
+            kept = tuple(os.path.join(root, '') for root in unlisted)
+
+            # Only a stat per file; unchanged files are not opened again
+            changes = Changes()
+            for path in live.slot_of:
+                if path.startswith(kept):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    changes.removed.add(path)
+                    continue
+                if live.stat(path) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                    changes.changed.add(path)
+            changed, removed = len(changes.changed), len(changes.removed)
+            if changes:
+                for event in self._apply_changes(changes, live, {}, cache, store):
+                    if event['event'] == 'group_update':
+                        matches[event['group']] = event['match']
+                    yield event
+
+            # Only deletions are noticed in those groups
+            for gid, paths in fixed.items():
+                present = [path for path in paths if path.startswith(kept) or os.path.exists(path)]
+                if len(present) == len(paths):
+                    continue
+                for path in paths:
+                    if path not in present:
+                        store.remove_file(path)
+                        removed += 1
+                        yield {'event': 'file_removed', 'path': path}
+                fixed[gid] = present if len(present) > 1 else []
+                match = matches[gid] if fixed[gid] else None
+                yield {
+                    'event': 'group_update',
+                    'group': gid,
+                    'match': match,
+                    'paths': fixed[gid],
+                    **store.set_group(gid, match, fixed[gid]),
+                }
+            store.commit()
+            yield {'event': 'revalidated', 'changed': changed, 'removed': removed}
+        finally:
+            cache.close()
+            store.close()
+
+        self.live = live
+        current = {gid: live.group(gid) for gid in live.groups}
+        current.update((gid, paths) for gid, paths in fixed.items() if paths)
+        gids = sorted(current)
+        self.duplicate_groups = [current[gid] for gid in gids]
+        self.group_matches = [matches[gid] for gid in gids]
+        yield {
+            'event': 'done',
+            'files': len(live),
+            'groups': len(gids),
+            'results': self.results_path,
+            'run': self.run,
+        }
+
+
+    def watch(self, poll_interval=POLL_INTERVAL, reopen=False, run=None):
+        # scan() (or reopen(run) instead), then keep watching the roots until
+        # cancel(): changed files are re-hashed and only the groups they touch
+        # are updated, in the result store too. Extra events:
+        #   watching      backend ("inotify", or "polling" where it is unavailable;
+        #                 again with "polling" if inotify runs out of watches later)
+        #   file_removed  path
+        #   group_update  group (id from the "group" events), match, paths,
+        #                 sizes, dimensions, reclaimable
+        #                 (paths empty once the group no longer has duplicates)
+        # For a scan, the watches go up before it starts, so files changed
+        # while it runs are picked up by the first batch. reopen() only knows
+        # the roots once it has loaded them, so after it the whole tree is
+        # compared once instead, which also finds files added since.
+        watcher = None if reopen else self._watcher(poll_interval)
+        cache = store = None
+        try:
+            cancelled = False
+            for event in self.reopen(run) if reopen else self.scan():
+                cancelled = cancelled or event['event'] == 'cancelled'
+                yield event
+            if cancelled:
+                return
+
+            live = self.live if reopen else LiveIndex.from_engine(self)
+            if watcher is None:
+                watcher = self._watcher(poll_interval)
+            yield {'event': 'watching', 'backend': watcher.backend}
+
+            # Files that failed to hash, so polling does not retry them until they change
+            failed = {}
+            cache = HashCache(self.cache_path)
+            store = ResultStore(self.results_path)
+            store.find_run(run=self.run)
+            changes = Changes()
+            changes.rescan = reopen
+            while not self.stop.is_set():
+                if changes:
+                    yield from self._apply_changes(changes, live, failed, cache, store)
+                    store.commit()
+                changes = watcher.wait(WATCH_TIMEOUT)
+                if watcher.failed:
+                    # Folders created from now on could not be watched; the
+                    # rescan in `changes` covers the one that failed
+                    watcher.close()
+                    watcher = PollingWatcher(poll_interval)
+                    yield {'event': 'watching', 'backend': watcher.backend}
+        finally:
+            if watcher is not None:
+                watcher.close()
+            if cache is not None:
+                cache.close()
+            if store is not None:
+                store.close()
+
+
+    def _watcher(self, poll_interval):
+        try:
+            return InotifyWatcher(self.roots, ALL_IMAGE_EXTS)
+        except OSError:
+            return PollingWatcher(poll_interval)
+
+
+    def _compare_tree(self, live, failed, changes):
+        # Full comparison against the tree on disk, for polling and for lost events
+        seen = set()
+        unlisted = set()
+        for root in self.roots:
+            for path, st, error in walk_images(root, ALL_IMAGE_EXTS, unlisted):
+                if error is not None:
+                    continue
+                seen.add(path)
+                known = live.stat(path) if path in live else failed.get(path)
+                if known != (st.st_size, st.st_mtime_ns, st.st_ino):
+                    changes.changed.add(path)
+        # Files in folders that could not be listed are not taken for deleted
+        kept = tuple(os.path.join(directory, '') for directory in unlisted)
+        changes.removed.update(
+            path for path in live.slot_of if path not in seen and not path.startswith(kept)
+        )
+
+
+    def _dimensions(self, cache, files):
+        # (width, height) of each (path, stat) as recorded when it was hashed,
+        # so group details need no file opened; None where the cache has none
+        dimensions = []
+        for path, st in files:
+            value = cache.lookup(path, st, 'dimensions')
+            dimensions.append(tuple(int(n) for n in value.split('x')) if value else None)
+        return dimensions
+
+
+    def _apply_changes(self, changes, live, failed, cache, store):
+        if changes.rescan:
+            self._compare_tree(live, failed, changes)
+        removed = set(changes.removed)
+        for directory in changes.removed_dirs:
+            removed.update(live.paths_under(directory))
+
+        changed = {}
+        for path in changes.changed:
+            try:
+                st = os.stat(path)
+            except OSError:
+                removed.add(path)
+                continue
+            removed.discard(path)
+            changed[path] = FileStat(st.st_size, st.st_mtime_ns, st.st_ino)
+
+        # A file moved within the roots keeps its stat; carry its cached hashes
+        # and dimensions over to the new path so it is not decoded again
+        moved_from = {live.stat(path): path for path in removed if path in live}
+        for path, st in changed.items():
+            old = moved_from.get(st)
+            if old is None:
+                continue
+            for column in (cache_column(path, self.use_exif_thumbnails), 'dimensions'):
+                record = cache.lookup(old, st, column)
+                if record is not None:
+                    cache.store(path, st, record, column)
+
+        # New files go in before old ones come out, so a group whose files
+        # were moved or replaced keeps its id
+        affected = set()
+        todo = []
+        for path, st in sorted(changed.items()):
+            if path in live and live.stat(path) == st or failed.get(path) == st:
+                continue
+            record = cache.lookup(path, st, cache_column(path, self.use_exif_thumbnails))
+            if record is None:
+                todo.append((path, path))
+                continue
+            affected |= live.add(path, st, parse_hashes(record)['phash'])
+            store.add_file(path, st, record)
+            yield {'event': 'file_hashed', 'path': path, 'hash': record, 'cached': True, 'copy_of': None}
+
+        # A pool only pays off for a burst of new files
+        workers = self.workers if len(todo) >= CHUNK_SIZE else 1
+        results = iter_hashes(todo, workers=workers, use_exif_thumbnails=self.use_exif_thumbnails)
+        for result in results:
+            if self.stop.is_set():
+                results.close()
+                break
+            if result is None:
+                continue
+            _, path, record, error, _, size = result
+            st = changed[path]
+            if error is not None:
+                failed[path] = st
+                affected |= live.remove(path)
+                store.add_file(path, st, error=error)
+                yield {'event': 'error', 'path': path, 'error': error}
+                continue
+            cache.store(path, st, record, cache_column(path, self.use_exif_thumbnails))
+            cache.store(path, st, f"{size[0]}x{size[1]}", 'dimensions')
+            affected |= live.add(path, st, parse_hashes(record)['phash'])
+            store.add_file(path, st, record)
+            yield {'event': 'file_hashed', 'path': path, 'hash': record, 'cached': False, 'copy_of': None}
+        cache.commit()
+
+        for path in sorted(removed):
+            failed.pop(path, None)
+            if path in live:
+                affected |= live.remove(path)
+                store.remove_file(path)
+                yield {'event': 'file_removed', 'path': path}
+
+        for gid in sorted(affected):
+            paths = live.group(gid)
+            match = live.match(gid, cache) if paths else None
+            dimensions = self._dimensions(cache, [(path, live.stat(path)) for path in paths])
+            yield {
+                'event': 'group_update',
+                'group': gid,
+                'match': match,
+                'paths': paths,
+                **store.set_group(gid, match, paths, dimensions),
+            }
@@ -0,0 +1,101 @@
+import hashlib
+
+import numpy as np
+
+
+# Bytes read from each end of a file for the partial digest
+PARTIAL_BYTES = 64 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def partial_digest(path, size):
+    # Digest of the first and last 64 KiB; covers the whole file when it is small
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            f.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            h.update(f.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+
+def full_digest(path):
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def _bucket(ids, key):
+    buckets = {}
+    for i in ids:
+        try:
+            buckets.setdefault(key(i), []).append(i)
+        except OSError:
+            # Unreadable here; the perceptual pass will report the error
+            continue
+    return [grp for grp in buckets.values() if len(grp) > 1]
+
+
+def find_exact_groups(files, cache=None):
+    # Group byte-identical files of a FileList without decoding them, as
+    # lists of file ids. Files are bucketed by size first, then by a digest of
+    # both ends, and only files that still collide are read in full.
+    def cached(column, compute):
+        def key(i):
+            path, st = files.paths[i], files.stat(i)
+            value = cache.lookup(path, st, column) if cache else None
+            if value is None:
+                value = compute(path, st)
+                if cache:
+                    cache.store(path, st, value, column)
+            return value
+        return key
+
+    # Only files sharing their size with another file are candidates.
+    # Empty files are not images; leave them to the perceptual pass to report.
+    if not len(files):
+        return []
+    sizes = np.frombuffer(files.sizes, dtype=np.int64)
+    _, inverse, counts = np.unique(sizes, return_inverse=True, return_counts=True)
+    by_size = {}
+    for i in np.flatnonzero((counts[inverse.ravel()] > 1) & (sizes > 0)).tolist():
+        by_size.setdefault(files.sizes[i], []).append(i)
+    del sizes
+
+    partial_key = cached('partial_digest', lambda path, st: partial_digest(path, st.st_size))
+    full_key = cached('full_digest', lambda path, st: full_digest(path))
+
+    groups = []
+    for size, ids in by_size.items():
+        for candidates in _bucket(ids, partial_key):
+            if size <= 2 * PARTIAL_BYTES:
+                # The partial digest already covered every byte
+                groups.append(candidates)
+            else:
+                groups.extend(_bucket(candidates, full_key))
+    return groups
+
+
+class SizeFilter:
+    # Remembers which file sizes have been seen, in a fixed 2 MiB bitmap.
+    # A file whose size was not seen before cannot be an exact copy of an
+    # earlier file; a collision only means a file is checked when it need not be.
+
+    BITS = 1 << 24
+
+    def __init__(self):
+        self.bits = np.zeros(self.BITS // 8, dtype=np.uint8)
+
+
+    def seen_before(self, size):
+        # Marks `size` as seen and returns whether it (probably) was already
+        slot = hash(size) % self.BITS
+        byte, bit = divmod(slot, 8)
+        seen = bool(self.bits[byte] & (1 << bit))
+        self.bits[byte] |= 1 << bit
+        return seen
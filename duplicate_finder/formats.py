@@ -0,0 +1,40 @@
+import os
+
+
+# Defining and grouping image file extension tuples
+RASTER_EXTS = (
+    '.png', '.apng', '.jpg', '.jpeg', '.jpe', '.jfif', '.pjpeg', '.pjp',
+    '.bmp', '.dib', '.gif', '.tiff', '.tif', '.webp', '.heif', '.heic',
+    '.avif', '.jp2', '.j2k', '.jpf', '.jpx', '.jpm', '.mj2', '.jxr', '.hdp',
+    '.wdp', '.exr', '.hdr', '.psd', '.psb', '.ico', '.cur', '.xbm', '.xpm',
+    '.pcx', '.tga', '.dds', '.ras', '.sgi', '.rgb', '.rgba', '.pic', '.pct',
+    '.mng', '.jng', '.bpg', '.flif', '.qoi', '.pam', '.pbm', '.pgm', '.ppm', '.pnm',
+)
+VECTOR_EXTS = (
+    '.svg', '.svgz', '.eps', '.ps', '.ai', '.pdf', '.cdr', '.wmf', '.emf',
+    '.dxf', '.cgm', '.vml',
+)
+RAW_EXTS = (
+    '.3fr', '.ari', '.arw', '.srf', '.sr2', '.bay', '.braw', '.cri',
+    '.crw', '.cr2', '.cr3', '.cap', '.iiq', '.eip', '.dcs', '.dcr',
+    '.drf', '.k25', '.kdc', '.dng', '.erf', '.fff', '.gpr', '.mef',
+    '.mdc', '.mos', '.mrw', '.nef', '.nrw', '.orf', '.pef', '.ptx',
+    '.pxn', '.r3d', '.raf', '.raw', '.rw2', '.rwl', '.rwz', '.srw',
+    '.tco', '.x3f',
+)
+ALL_IMAGE_EXTS = RASTER_EXTS + VECTOR_EXTS + RAW_EXTS
+
+# JPEG variants that may carry an EXIF thumbnail
+JPEG_EXTS = ('.jpg', '.jpeg', '.jpe', '.jfif', '.pjpeg', '.pjp')
+
+
+def ext_group(path):
+    # "raster", "vector", "raw" or "other", for per-format statistics
+    ext = os.path.splitext(path)[1].lower()
+    if ext in RAW_EXTS:
+        return 'raw'
+    if ext in VECTOR_EXTS:
+        return 'vector'
+    if ext in RASTER_EXTS:
+        return 'raster'
+    return 'other'
@@ -0,0 +1,189 @@
+import math
+from itertools import combinations
+
+import numpy as np
+
+
+HASH_BITS = 64
+DEFAULT_THRESHOLD = 4
+# Highest threshold offered. Up to 5 bits the index splits hashes into three
+# segments searched within 1 bit each, and 1M hashes group in seconds; from 6
+# bits on each segment needs a 2-bit search and the same input takes minutes.
+MAX_THRESHOLD = 5
+
+MATCH_EXACT = "exact"
+MATCH_PERCEPTUAL = "perceptual"
+
+# Query hashes are matched against the index in blocks to bound peak memory
+QUERY_BLOCK = 1 << 20
+
+
+def popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    # NumPy < 2.0 has no popcount ufunc
+    bits = np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1)
+    return bits.sum(axis=1)
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            # Path halving keeps the trees flat
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+
+# Widest segment we build a direct-address bucket table for (2**24 entries)
+MAX_SEGMENT_BITS = 24
+
+
+def _probe_cost(count, segments, threshold):
+    # Rough number of candidates examined: probes per segment times bucket size
+    width = HASH_BITS // segments
+    probes = sum(math.comb(width, r) for r in range(threshold // segments + 1))
+    return segments * probes * (1 + count / (1 << width))
+
+
+def _segment_bounds(count, threshold):
+    # Multi-index hashing: one exact-lookup table per segment. Fewer, wider
+    # segments mean sparser buckets but more flipped-bit probes per lookup;
+    # pick the split with the lowest estimated cost.
+    fewest = math.ceil(HASH_BITS / MAX_SEGMENT_BITS)
+    segments = min(
+        range(fewest, 17),
+        key=lambda m: _probe_cost(count, m, threshold)
+    )
+    edges = np.linspace(0, HASH_BITS, segments + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _flip_masks(width, radius):
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(width), r):
+            masks.append(sum(1 << b for b in bits))
+    return masks
+
+
+def near_duplicate_pairs(hashes, threshold):
+    # Return index pairs (a, b), a < b, of hashes within `threshold` bits.
+    # By the pigeonhole principle two hashes within t bits differ by at most
+    # t // m bits in at least one of m segments, so only hashes sharing a
+    # segment value (up to that many flipped bits) are ever compared.
+    count = len(hashes)
+    pairs_a, pairs_b = [], []
+    if count < 2:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+
+    bounds = _segment_bounds(count, threshold)
+    radius = threshold // len(bounds)
+
+    for lo_bit, hi_bit in bounds:
+        width = int(hi_bit - lo_bit)
+        seg_mask = np.uint64((1 << width) - 1)
+        seg = ((hashes >> np.uint64(lo_bit)) & seg_mask).astype(np.int32)
+
+        # Bucket table: members of bucket v are order[starts[v]:starts[v + 1]]
+        order = np.argsort(seg, kind="stable").astype(np.int32)
+        starts = np.zeros((1 << width) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(seg, minlength=1 << width), out=starts[1:])
+
+        for flip in _flip_masks(width, radius):
+            for start in range(0, count, QUERY_BLOCK):
+                query = np.arange(start, min(start + QUERY_BLOCK, count), dtype=np.int32)
+                probe = seg[query] ^ np.int32(flip)
+                lo = starts[probe]
+                counts = starts[probe + 1] - lo
+
+                # Most buckets hold a single hash; take those without expansion
+                single = counts == 1
+                a = query[single]
+                b = order[lo[single]]
+
+                # Expand every (query, bucket member) pair for the crowded buckets
+                multi = counts > 1
+                if multi.any():
+                    m_counts = counts[multi]
+                    total = int(m_counts.sum())
+                    offsets = np.arange(total) - np.repeat(np.cumsum(m_counts) - m_counts, m_counts)
+                    a = np.concatenate([a, np.repeat(query[multi], m_counts)])
+                    b = np.concatenate([b, order[np.repeat(lo[multi], m_counts) + offsets]])
+
+                keep = a < b
+                a, b = a[keep], b[keep]
+                keep = popcount(hashes[a] ^ hashes[b]) <= threshold
+                pairs_a.append(a[keep])
+                pairs_b.append(b[keep])
+
+    if not pairs_a:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def group_indices(values, threshold=DEFAULT_THRESHOLD):
+    # `values` is a uint64 array of hashes, one per file. Returns duplicate
+    # groups as arrays of positions into `values`, for groups of more than one
+    # file. Files are grouped transitively, so A~B and B~C puts A, B and C together.
+    if len(values) < 2:
+        return []
+
+    # Identical hashes collapse with a sort; only distinct values are searched
+    unique, inverse = np.unique(values, return_inverse=True)
+    labels = np.arange(len(unique))
+    if threshold > 0:
+        pair_a, pair_b = near_duplicate_pairs(unique, threshold)
+        uf = UnionFind(len(unique))
+        for a, b in zip(pair_a.tolist(), pair_b.tolist()):
+            uf.union(a, b)
+        touched = np.unique(np.concatenate([pair_a, pair_b]))
+        labels[touched] = [uf.find(i) for i in touched.tolist()]
+
+    file_labels = labels[inverse.ravel()]
+    order = np.argsort(file_labels, kind="stable")
+    _, starts, counts = np.unique(file_labels[order], return_index=True, return_counts=True)
+    return [
+        order[start:start + count]
+        for start, count in zip(starts[counts > 1].tolist(), counts[counts > 1].tolist())
+    ]
+
+
+def merge_exact_groups(perceptual_groups, exact_groups):
+    # Only the first path of each exact group was perceptually hashed. Its
+    # copies join whatever perceptual group it landed in; exact groups that
+    # matched nothing else are kept on their own.
+    # Returns (groups, matches) where matches[i] is MATCH_EXACT or MATCH_PERCEPTUAL.
+    copies = {grp[0]: grp[1:] for grp in exact_groups}
+    groups, matches = [], []
+    absorbed = set()
+
+    for grp in perceptual_groups:
+        expanded = []
+        for path in grp:
+            expanded.append(path)
+            if path in copies:
+                expanded.extend(copies[path])
+                absorbed.add(path)
+        groups.append(expanded)
+        matches.append(MATCH_PERCEPTUAL)
+
+    for grp in exact_groups:
+        if grp[0] not in absorbed:
+            groups.append(grp)
+            matches.append(MATCH_EXACT)
+    return groups, matches
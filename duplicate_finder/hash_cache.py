@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import time
+
+
+# Bump whenever the way hashes are computed changes, so stale entries get dropped
+SCHEMA_VERSION = 7
+
+DEFAULT_CACHE_NAME = ".hash_cache.sqlite3"
+
+# Values cached per file; any of them may still be missing for a given row.
+# "dimensions" is the image's "WIDTHxHEIGHT", recorded when it is hashed.
+CACHED_COLUMNS = ("hashes", "thumb_hashes", "partial_digest", "full_digest", "dimensions")
+
+
+def default_cache_path():
+    # Lives next to the app's .trash directory
+    return os.path.join(os.getcwd(), DEFAULT_CACHE_NAME)
+
+
+class HashCache:
+    # On-disk cache of perceptual hash records and content digests keyed by path,
+    # size, mtime and inode. A connection is bound to the thread that opened
+    # it, so open the cache from inside the scan thread rather than the Tk thread.
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_cache_path()
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS files")
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " inode INTEGER NOT NULL,"
+            + ",".join(f" {column} TEXT" for column in CACHED_COLUMNS)
+            + ")"
+        )
+        # Work list of an unfinished scan per set of roots: every file found so
+        # far, in the order found, and whether the walk had completed
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " roots TEXT PRIMARY KEY,"
+            " walk_done INTEGER NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_paths ("
+            " roots TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " path TEXT NOT NULL,"
+            " PRIMARY KEY (roots, seq))"
+        )
+        self.conn.commit()
+        self.pending = 0
+
+
+    def lookup(self, path, st, column="hashes"):
+        # Return the cached value if the file is unchanged since it was computed
+        if column not in CACHED_COLUMNS:
+            raise ValueError(f"Unknown cache column: {column}")
+        row = self.conn.execute(
+            f"SELECT size, mtime_ns, inode, {column} FROM files WHERE path = ?",
+            (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, inode, value = row
+        if (size, mtime_ns, inode) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return value
+
+
+    def store(self, path, st, value, column="hashes"):
+        if column not in CACHED_COLUMNS:
+            raise ValueError(f"Unknown cache column: {column}")
+        # Keep the row's other values only if they were computed from the same file state
+        others = ", ".join(
+            f"{other} = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns"
+            f" AND inode = excluded.inode THEN {other} ELSE NULL END"
+            for other in CACHED_COLUMNS if other != column
+        )
+        self.conn.execute(
+            f"INSERT INTO files (path, size, mtime_ns, inode, {column})"
+            " VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(path) DO UPDATE SET"
+            f" {column} = excluded.{column}, {others},"
+            " size = excluded.size, mtime_ns = excluded.mtime_ns, inode = excluded.inode",
+            (path, st.st_size, st.st_mtime_ns, st.st_ino, value)
+        )
+        # Commit in batches so an interrupted scan keeps most of its work
+        self.pending += 1
+        if self.pending >= 500:
+            self.commit()
+
+
+    def evict_missing(self, folder_path, seen_paths, unlisted=()):
+        # Drop entries under folder_path whose files were not found by this
+        # scan, except under the directories in `unlisted`, which the scan
+        # could not look into. A range query on the primary key avoids LIKE
+        # escaping of % and _ in paths.
+        prefix = os.path.join(os.path.abspath(folder_path), "")
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        kept = tuple(os.path.join(directory, "") for directory in unlisted)
+        stale = [
+            (path,)
+            for (path,) in self.conn.execute(
+                "SELECT path FROM files WHERE path >= ? AND path < ?",
+                (prefix, upper)
+            )
+            if path not in seen_paths and not path.startswith(kept)
+        ]
+        self.conn.executemany("DELETE FROM files WHERE path = ?", stale)
+        self.commit()
+        return len(stale)
+
+
+    def load_checkpoint(self, roots):
+        # (paths, walk_done) left by an interrupted scan of these roots, or None
+        key = "\n".join(roots)
+        row = self.conn.execute(
+            "SELECT walk_done FROM checkpoints WHERE roots = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        paths = self.conn.execute(
+            "SELECT path FROM checkpoint_paths WHERE roots = ? ORDER BY seq", (key,)
+        )
+        return (path for (path,) in paths), bool(row[0])
+
+
+    def save_checkpoint(self, roots, first_seq, paths, walk_done):
+        # Replace the work list from position first_seq on with `paths`, and
+        # commit it together with every hash stored since the last commit
+        key = "\n".join(roots)
+        self.conn.execute(
+            "DELETE FROM checkpoint_paths WHERE roots = ? AND seq >= ?", (key, first_seq)
+        )
+        self.conn.executemany(
+            "INSERT INTO checkpoint_paths (roots, seq, path) VALUES (?, ?, ?)",
+            ((key, seq, path) for seq, path in enumerate(paths, first_seq))
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (roots, walk_done, updated) VALUES (?, ?, ?)",
+            (key, int(walk_done), time.time())
+        )
+        self.commit()
+
+
+    def clear_checkpoint(self, roots):
+        key = "\n".join(roots)
+        self.conn.execute("DELETE FROM checkpoint_paths WHERE roots = ?", (key,))
+        self.conn.execute("DELETE FROM checkpoints WHERE roots = ?", (key,))
+        self.commit()
+
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,117 @@
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from duplicate_finder.grouping import group_indices
+from duplicate_finder.hashing import HASH_KINDS, parse_hashes
+
+
+# Just the fields the cache and exact matching look at; quacks like os.stat_result
+FileStat = namedtuple('FileStat', 'st_size st_mtime_ns st_ino')
+
+
+class PathTable:
+    # Every path lives in one UTF-8 buffer; path i is data[offsets[i]:offsets[i + 1]].
+    # Costs 8 bytes per path on top of the encoded path itself, instead of a
+    # full Python str object plus a list slot.
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('q', [0])
+
+
+    def append(self, path):
+        self.data += path.encode('utf-8', 'surrogateescape')
+        self.offsets.append(len(self.data))
+        return len(self.offsets) - 2
+
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:end].decode('utf-8', 'surrogateescape')
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def fingerprints(self):
+        # Sorted 64-bit hashes of every path, for compact membership tests.
+        # str hashes are salted per process, so compare only within one process.
+        prints = np.fromiter((hash(path) for path in self), dtype=np.int64, count=len(self))
+        prints.sort()
+        return prints
+
+
+class PathSet:
+    # Read-only `in` test over a PathTable that keeps only 8 bytes per path.
+    # A hash collision can only make a missing path look present.
+
+    def __init__(self, table):
+        self.prints = table.fingerprints()
+
+
+    def __contains__(self, path):
+        value = hash(path)
+        i = np.searchsorted(self.prints, value)
+        return i < len(self.prints) and self.prints[i] == value
+
+
+class FileList:
+    # Paths and stat fields of the files found by a scan, in flat arrays
+
+    def __init__(self):
+        self.paths = PathTable()
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.inodes = array('Q')
+
+
+    def append(self, path, st):
+        self.sizes.append(st.st_size)
+        self.mtimes.append(st.st_mtime_ns)
+        self.inodes.append(st.st_ino)
+        return self.paths.append(path)
+
+
+    def stat(self, i):
+        return FileStat(self.sizes[i], self.mtimes[i], self.inodes[i])
+
+
+    def __len__(self):
+        return len(self.sizes)
+
+
+class HashIndex:
+    # Hash records packed as one uint64 array per hash kind, each row pointing
+    # at a row of a PathTable
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.ids = array('q')
+        self.values = {kind: array('Q') for kind in HASH_KINDS}
+
+
+    def add(self, path_id, record):
+        self.ids.append(path_id)
+        for kind, value in parse_hashes(record).items():
+            self.values[kind].append(value)
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def groups(self, threshold, kind='phash'):
+        # Duplicate groups as lists of path ids
+        if not self.ids:
+            return []
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        values = np.frombuffer(self.values[kind], dtype=np.uint64)
+        return [ids[members].tolist() for members in group_indices(values, threshold)]
@@ -0,0 +1,323 @@
+import io
+import os
+import signal
+import struct
+import time
+from concurrent.futures import (
+    ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+)
+
+from PIL import Image
+import numpy as np
+import scipy.fftpack
+
+from duplicate_finder.formats import JPEG_EXTS, RAW_EXTS
+from duplicate_finder.previews import extract_exif_thumbnail, extract_raw_preview
+
+
+# Paths sent to a worker process per task; big enough to amortize the IPC cost
+CHUNK_SIZE = 32
+
+# pHash works on a 32x32 thumbnail, so anything beyond this edge length is wasted decoding
+DECODE_SIZE = 128
+
+# Modes Image.reduce() averages as plain channels; palette, bilevel, 16-bit
+# and alpha images are converted to grayscale before reducing instead
+REDUCE_MODES = ('L', 'RGB', 'CMYK', 'YCbCr', 'I', 'F')
+
+# JPEG 2000 codestream markers: start of codestream + image size, coding
+# style (default and per component), start of the first tile
+J2K_SOC_SIZ = b'\xff\x4f\xff\x51'
+J2K_COD, J2K_COC, J2K_SOT = 0xFF52, 0xFF53, 0xFF90
+
+# Bytes searched for the codestream main header
+J2K_HEADER_BYTES = 64 * 1024
+
+# Hashes computed for every image, in the order they are stored in a hash record
+HASH_KINDS = ('phash', 'dhash', 'ahash')
+
+# Same parameters and resampling filter as imagehash's defaults
+HASH_SIZE = 8
+PHASH_SIZE = HASH_SIZE * 4
+RESAMPLE = Image.Resampling.LANCZOS
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _select_smallest_frame(img):
+    # Multi-resolution containers: switch to the smallest stored image that is
+    # still at least DECODE_SIZE on its short edge (or the largest one otherwise)
+    def pick(sizes):
+        big_enough = [s for s in sizes if min(s[:2]) >= DECODE_SIZE]
+        if big_enough:
+            return min(big_enough, key=lambda s: s[0] * s[1])
+        return max(sizes, key=lambda s: s[0] * s[1])
+
+    if img.format == 'ICO' and img.info.get('sizes'):
+        img.size = pick(img.info['sizes'])
+
+    elif img.format == 'TIFF' and getattr(img, 'n_frames', 1) > 1:
+        # Pyramid levels share the aspect ratio of the full-size page; other pages are separate images
+        width, height = img.size
+        levels = []
+        for frame in range(img.n_frames):
+            img.seek(frame)
+            w, h = img.size
+            if abs(w / h - width / height) < 0.02:
+                levels.append((w, h, frame))
+        img.seek(pick(levels)[2])
+
+
+def _jpeg2000_levels(img):
+    # Wavelet decomposition levels in the main header of a JPEG 2000
+    # codestream, the most its decoder can reduce by; the lowest of the
+    # COD and COC segments, or 0 when they cannot be found
+    pos = img.fp.tell()
+    try:
+        img.fp.seek(0)
+        head = img.fp.read(J2K_HEADER_BYTES)
+    finally:
+        img.fp.seek(pos)
+    start = head.find(J2K_SOC_SIZ)
+    if start < 0:
+        return 0
+    # Component indexes in COC take two bytes when there are over 256 components
+    components = struct.unpack_from('>H', head, start + 40)[0] if start + 42 <= len(head) else 0
+    levels = []
+    i = start + 2
+    while i + 4 <= len(head):
+        marker, length = struct.unpack_from('>HH', head, i)
+        if marker == J2K_SOT or marker >> 8 != 0xFF:
+            break
+        if marker == J2K_COD and i + 10 <= len(head):
+            levels.append(head[i + 9])
+        elif marker == J2K_COC:
+            offset = i + 6 + (2 if components > 256 else 1)
+            if offset < len(head):
+                levels.append(head[offset])
+        i += 2 + length
+    return min(levels) if levels else 0
+
+
+def load_for_hash(img):
+    # Decode no more of the image than pHash needs: JPEG decodes straight to a
+    # scaled-down grayscale image via draft mode, JPEG 2000 decodes one of its
+    # lower resolution levels, and other formats are reduced by an integer
+    # factor right after decoding, before the grayscale conversion, so no
+    # full-size converted copy is ever made.
+    _select_smallest_frame(img)
+    img.draft('L', (DECODE_SIZE, DECODE_SIZE))
+    if img.format == 'JPEG2000':
+        # Each level halves both edges, down to as many levels as the
+        # codestream was encoded with. Pillow rounds the reduced size to
+        # nearest where OpenJPEG rounds up, and a level where the two
+        # disagree fails to decode, so a lower one is used then.
+        most = _jpeg2000_levels(img)
+        levels = 0
+        while levels < most and min(img.size) >> (levels + 1) >= DECODE_SIZE:
+            levels += 1
+        while levels and any(
+            -(-edge >> levels) != (edge + (1 << levels >> 1)) >> levels for edge in img.size
+        ):
+            levels -= 1
+        img.reduce = levels
+        img.load()
+        # While set, the plugin's reduce level shadows Image.reduce()
+        img.reduce = 0
+    else:
+        img.load()
+
+    factor = min(img.size) // DECODE_SIZE
+    if img.mode not in REDUCE_MODES:
+        img = img.convert('L')
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.mode != 'L':
+        img = img.convert('L')
+    return img
+
+
+def cache_column(path, use_exif_thumbnails=False):
+    # Hashes taken from EXIF thumbnails are cached apart from full-image hashes
+    if use_exif_thumbnails and path.lower().endswith(JPEG_EXTS):
+        return 'thumb_hashes'
+    return 'hashes'
+
+
+def open_source(path, use_exif_thumbnails=False):
+    # RAW files are hashed from their embedded JPEG preview, since PIL cannot
+    # decode most of them; JPEGs optionally from their EXIF thumbnail
+    ext = os.path.splitext(path)[1].lower()
+    data = None
+    if ext in RAW_EXTS:
+        data = extract_raw_preview(path)
+    elif use_exif_thumbnails and ext in JPEG_EXTS:
+        data = extract_exif_thumbnail(path)
+    return io.BytesIO(data) if data else path
+
+
+def _clock():
+    return time.perf_counter(), time.process_time()
+
+
+def _elapsed(start, end):
+    return end[0] - start[0], end[1] - start[1]
+
+
+def hash_thumbnails(path, use_exif_thumbnails=False, timing=None):
+    # Decode once and build the small grayscale images every hash needs.
+    # Each is resized from the same grayscale image, exactly as imagehash does.
+    # Also returns the image's (width, height) from its header, taken before
+    # any reduced decoding; RAW files report their embedded preview, JPEGs
+    # hashed from their EXIF thumbnail their own size.
+    # Wall/CPU seconds spent opening and decoding are stored in `timing`.
+    start = _clock()
+    source = open_source(path, use_exif_thumbnails)
+    with Image.open(source) as img:
+        opened = _clock()
+        size = img.size
+        if source is not path and path.lower().endswith(JPEG_EXTS):
+            with Image.open(path) as full:
+                size = full.size
+        gray = load_for_hash(img)
+        thumbs = (
+            np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE), RESAMPLE)),
+            np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), RESAMPLE)),
+            np.asarray(gray.resize((HASH_SIZE, HASH_SIZE), RESAMPLE)),
+        )
+    if timing is not None:
+        timing['open'] = _elapsed(start, opened)
+        timing['decode'] = _elapsed(opened, _clock())
+    return thumbs, size
+
+
+def _to_hex(bits):
+    # Row-major bits, first bit most significant, as imagehash's str(ImageHash)
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return [row.tobytes().hex() for row in packed]
+
+
+def batch_hashes(phash_pixels, dhash_pixels, ahash_pixels):
+    # Vectorized pHash, dHash and aHash over stacks of thumbnails (N x H x W).
+    # Bit-for-bit the same as imagehash.phash / dhash / average_hash.
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(phash_pixels, axis=1), axis=2)
+    low = dct[:, :HASH_SIZE, :HASH_SIZE]
+    med = np.median(low.reshape(len(low), -1), axis=1)
+    phash = low > med[:, None, None]
+
+    dhash = dhash_pixels[:, :, 1:] > dhash_pixels[:, :, :-1]
+
+    avg = ahash_pixels.mean(axis=(1, 2))
+    ahash = ahash_pixels > avg[:, None, None]
+
+    return [':'.join(hashes) for hashes in zip(_to_hex(phash), _to_hex(dhash), _to_hex(ahash))]
+
+
+def parse_hashes(record):
+    # Hash record ("phash:dhash:ahash" hex) -> dict of kind -> int
+    return dict(zip(HASH_KINDS, (int(h, 16) for h in record.split(':'))))
+
+
+def hash_chunk(paths, use_exif_thumbnails=False):
+    # Returns one (path, hash record, None, timing, (width, height)) or (path,
+    # None, error message, timing, None) per path. timing maps "open", "decode"
+    # and "hash" to (wall, cpu) seconds; the batched hash time is split evenly
+    # over the chunk.
+    results = [None] * len(paths)
+    timings = [{} for _ in paths]
+    decoded, thumbs, sizes = [], [], []
+    for i, path in enumerate(paths):
+        start = _clock()
+        try:
+            thumb, size = hash_thumbnails(path, use_exif_thumbnails, timings[i])
+            thumbs.append(thumb)
+            sizes.append(size)
+            decoded.append(i)
+        except Exception as e:
+            timings[i].setdefault('open', _elapsed(start, _clock()))
+            results[i] = (path, None, str(e), timings[i], None)
+
+    if decoded:
+        start = _clock()
+        stacks = [np.stack(kind) for kind in zip(*thumbs)]
+        records = batch_hashes(*stacks)
+        wall, cpu = _elapsed(start, _clock())
+        for i, record, size in zip(decoded, records, sizes):
+            timings[i]['hash'] = (wall / len(decoded), cpu / len(decoded))
+            results[i] = (paths[i], record, None, timings[i], size)
+    return results
+
+
+def hash_file(path, use_exif_thumbnails=False):
+    return hash_chunk([path], use_exif_thumbnails)[0]
+
+
+def _init_worker():
+    # Ctrl+C reaches the whole process group; only the scan decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _chunks(items, chunk_size):
+    # Group items into lists of up to chunk_size, followed by a flag telling
+    # whether the chunk was cut short by a None (flush) item
+    chunk = []
+    for item in items:
+        if item is None:
+            yield chunk, True
+            chunk = []
+            continue
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk, False
+            chunk = []
+    if chunk:
+        yield chunk, False
+
+
+def iter_hashes(items, workers=None, chunk_size=CHUNK_SIZE, use_exif_thumbnails=False):
+    # `items` yields (key, path) pairs; yields (key, path, hash record, error,
+    # timing, dimensions) as results come back, in completion order. Only a few chunks per worker
+    # are in flight at once, so memory stays bounded and results stream back
+    # while later chunks are still being hashed.
+    # A None item flushes the partial chunk right away (so a slow producer
+    # does not hold back work) and is echoed back as None once finished
+    # results are collected, so the consumer gets a chance to run.
+    workers = workers or default_workers()
+    max_in_flight = workers * 2
+
+    if workers <= 1:
+        for chunk, flushed in _chunks(items, chunk_size):
+            if chunk:
+                keys, paths = zip(*chunk)
+                for key, result in zip(keys, hash_chunk(list(paths), use_exif_thumbnails)):
+                    yield (key,) + result
+            if flushed:
+                yield None
+        return
+
+    def collect(future, keys):
+        return [(key,) + result for key, result in zip(keys, future.result())]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        in_flight = {}
+        try:
+            for chunk, flushed in _chunks(items, chunk_size):
+                if chunk:
+                    keys, paths = zip(*chunk)
+                    in_flight[pool.submit(hash_chunk, list(paths), use_exif_thumbnails)] = keys
+                # Block only once enough work is queued; otherwise take whatever has finished
+                timeout = None if len(in_flight) >= max_in_flight else 0
+                finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield from collect(future, in_flight.pop(future))
+                if flushed:
+                    yield None
+            for future in as_completed(list(in_flight)):
+                yield from collect(future, in_flight.pop(future))
+        except GeneratorExit:
+            # Closed early (scan cancelled): drop queued chunks, so leaving the
+            # pool only waits for the chunks already being hashed
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
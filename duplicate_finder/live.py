@@ -0,0 +1,207 @@
+import os
+
+import numpy as np
+
+from duplicate_finder.exact import full_digest
+from duplicate_finder.grouping import (
+    DEFAULT_THRESHOLD, MATCH_EXACT, MATCH_PERCEPTUAL, group_indices, popcount
+)
+from duplicate_finder.hash_index import FileStat
+
+
+class LiveIndex:
+    # Duplicate groups that are kept up to date one file at a time, for watch
+    # mode. Each file has a slot holding its pHash and stat fields; slots of
+    # removed files are reused. Adding a file compares its hash against every
+    # live hash (one vectorized XOR/popcount pass) and merges the groups it
+    # touches; removing one re-splits only the group it was in.
+    # Group ids stay stable while a group changes, so consumers can update
+    # a displayed group in place.
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, capacity=1024):
+        self.threshold = threshold
+        self.paths = []
+        self.slot_of = {}
+        self.free = []
+        self.values = np.zeros(capacity, dtype=np.uint64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.sizes = np.zeros(capacity, dtype=np.int64)
+        self.mtimes = np.zeros(capacity, dtype=np.int64)
+        self.inodes = np.zeros(capacity, dtype=np.uint64)
+        self.group_of = np.full(capacity, -1, dtype=np.int64)
+        self.groups = {}
+        self.next_group = 0
+
+
+    @classmethod
+    def from_engine(cls, engine):
+        # Seed from a finished scan. Group ids are positions in
+        # engine.duplicate_groups, as numbered in its "group" events.
+        files, index = engine.files, engine.index
+        value_of = dict(zip(index.ids, index.values['phash']))
+        for grp in engine.exact_groups:
+            for copy in grp[1:]:
+                value_of[copy] = value_of.get(grp[0])
+        return cls.from_groups(
+            engine.threshold,
+            (
+                (files.paths[file_id], files.stat(file_id), value)
+                for file_id, value in value_of.items() if value is not None
+            ),
+            enumerate(engine.duplicate_groups),
+            capacity=len(files)
+        )
+
+
+    @classmethod
+    def from_groups(cls, threshold, files, groups, capacity=0):
+        # Seed from (path, stat, pHash) triples and (group id, paths) pairs
+        # whose groups are known to be correct, e.g. a saved result set
+        live = cls(threshold, capacity=max(1024, capacity))
+        for path, st, value in files:
+            live._store(path, st, value)
+        for gid, grp in groups:
+            # Exact copies of a file that could not be decoded have no pHash,
+            # so a group of them is left out
+            slots = [live.slot_of[path] for path in grp if path in live.slot_of]
+            if len(slots) >= 2:
+                live._set_group(gid, slots)
+            live.next_group = max(live.next_group, gid + 1)
+        return live
+
+
+    def __contains__(self, path):
+        return path in self.slot_of
+
+
+    def __len__(self):
+        return len(self.slot_of)
+
+
+    def stat(self, path):
+        slot = self.slot_of[path]
+        return FileStat(int(self.sizes[slot]), int(self.mtimes[slot]), int(self.inodes[slot]))
+
+
+    def value(self, path):
+        return int(self.values[self.slot_of[path]])
+
+
+    def _grow(self):
+        capacity = len(self.values) * 2
+        for name in ('values', 'alive', 'sizes', 'mtimes', 'inodes', 'group_of'):
+            old = getattr(self, name)
+            new = np.full(capacity, -1 if name == 'group_of' else 0, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+    def _store(self, path, st, value):
+        if self.free:
+            slot = self.free.pop()
+            self.paths[slot] = path
+        else:
+            slot = len(self.paths)
+            if slot == len(self.values):
+                self._grow()
+            self.paths.append(path)
+        self.slot_of[path] = slot
+        self.values[slot] = value
+        self.alive[slot] = True
+        self.sizes[slot], self.mtimes[slot], self.inodes[slot] = st.st_size, st.st_mtime_ns, st.st_ino
+        return slot
+
+
+    def _set_group(self, gid, slots):
+        self.groups[gid] = sorted(slots)
+        self.group_of[slots] = gid
+
+
+    def add(self, path, st, value):
+        # Add or replace a file by its pHash; returns the ids of the groups that changed
+        affected = self.remove(path) if path in self.slot_of else set()
+        slot = self._store(path, st, value)
+
+        used = len(self.paths)
+        near = np.flatnonzero(
+            self.alive[:used]
+            & (popcount(self.values[:used] ^ np.uint64(value)) <= self.threshold)
+        )
+        near = near[near != slot]
+        if not len(near):
+            return affected
+
+        # Join the new file and every group it touches into the oldest of those groups
+        gids = sorted({int(g) for g in self.group_of[near] if g >= 0})
+        members = set(near.tolist()) | {slot}
+        for gid in gids:
+            members.update(self.groups.pop(gid))
+        if gids:
+            gid = gids[0]
+            affected.update(gids)
+        else:
+            gid = self.next_group
+            self.next_group += 1
+        self._set_group(gid, list(members))
+        affected.add(gid)
+        return affected
+
+
+    def remove(self, path):
+        # Drop a file; returns the ids of the groups that changed
+        slot = self.slot_of.pop(path, None)
+        if slot is None:
+            return set()
+        self.alive[slot] = False
+        self.paths[slot] = None
+        self.free.append(slot)
+        gid = int(self.group_of[slot])
+        self.group_of[slot] = -1
+        if gid < 0:
+            return set()
+
+        # What is left of the group may fall apart into several groups; the
+        # first keeps the id, files left on their own leave the group
+        members = np.array([s for s in self.groups.pop(gid) if s != slot], dtype=np.int64)
+        self.group_of[members] = -1
+        affected = {gid}
+        for n, positions in enumerate(group_indices(self.values[members], self.threshold)):
+            new_gid = gid if n == 0 else self.next_group
+            if n:
+                self.next_group += 1
+            self._set_group(new_gid, members[positions].tolist())
+            affected.add(new_gid)
+        return affected
+
+
+    def paths_under(self, directory):
+        prefix = os.path.join(directory, '')
+        return [path for path in self.slot_of if path.startswith(prefix)]
+
+
+    def group(self, gid):
+        # Paths of a group, or an empty list once it no longer exists
+        return [self.paths[slot] for slot in self.groups.get(gid, ())]
+
+
+    def match(self, gid, cache=None):
+        # MATCH_EXACT when every file of the group has the same content
+        slots = self.groups.get(gid, ())
+        if len({int(self.sizes[slot]) for slot in slots}) != 1:
+            return MATCH_PERCEPTUAL
+        digests = set()
+        for slot in slots:
+            path = self.paths[slot]
+            st = self.stat(path)
+            digest = cache.lookup(path, st, 'full_digest') if cache else None
+            if digest is None:
+                try:
+                    digest = full_digest(path)
+                except OSError:
+                    return MATCH_PERCEPTUAL
+                if cache:
+                    cache.store(path, st, digest, 'full_digest')
+            digests.add(digest)
+            if len(digests) > 1:
+                return MATCH_PERCEPTUAL
+        return MATCH_EXACT
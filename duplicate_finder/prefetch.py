@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Threads reading ahead of the decoders. Reads mostly wait on the disk, so
+# this is tuned separately from the number of decode processes.
+DEFAULT_IO_WORKERS = 4
+
+# Files sorted by on-disk locality before being read; also how far the reads
+# may run ahead of the decoders
+IO_WINDOW = 256
+
+READ_SIZE = 1024 * 1024
+
+_buffers = threading.local()
+
+
+def warm(path, length=None):
+    # Pull the first `length` bytes of a file (all of it by default) into the
+    # OS page cache, so the decode process that opens it next reads from memory.
+    # posix_fadvise starts kernel readahead where supported; the data is still
+    # read through, since the hint is asynchronous and ignored by some network
+    # filesystems. Errors are left for the decoder to report.
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, length or 0, os.POSIX_FADV_WILLNEED)
+            buf = getattr(_buffers, 'buf', None)
+            if buf is None:
+                buf = _buffers.buf = bytearray(READ_SIZE)
+            view = memoryview(buf)
+            remaining = length if length is not None else float('inf')
+            while remaining > 0:
+                n = f.readinto(view[:min(READ_SIZE, remaining)])
+                if not n:
+                    break
+                remaining -= n
+    except OSError:
+        pass
+
+
+def prefetch(items, io_workers=DEFAULT_IO_WORKERS, window=IO_WINDOW,
+             locality=None, read_limit=None, stats=None):
+    # Reorders and reads ahead a stream of (key, path) items for iter_hashes.
+    # Up to `window` items are sorted by locality(key) (e.g. inode number, a
+    # good proxy for position on disk), read on `io_workers` threads, and
+    # passed on once read, in that order. read_limit(path) caps the bytes
+    # read for files whose decoders only look at the start.
+    # None items (flushes) pass through right away along with whatever has
+    # been read by then. io_workers=0 turns the stage off.
+    if io_workers <= 0:
+        yield from items
+        return
+
+    def read(path):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        warm(path, read_limit(path) if read_limit else None)
+        if stats is not None:
+            stats.add_stage('read', time.perf_counter() - wall, time.thread_time() - cpu)
+
+    with ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='prefetch') as pool:
+        ahead = deque()
+        batch = []
+
+        def submit():
+            if locality is not None:
+                batch.sort(key=lambda item: locality(item[0]))
+            for item in batch:
+                ahead.append((item, pool.submit(read, item[1])))
+            batch.clear()
+
+        def ready(block_over):
+            # Items whose reads are done, in order; waits while too many are pending
+            while ahead and (ahead[0][1].done() or len(ahead) > block_over):
+                item, future = ahead.popleft()
+                future.result()
+                yield item
+
+        for item in items:
+            if item is None:
+                submit()
+                yield from ready(window)
+                yield None
+                continue
+            batch.append(item)
+            if len(batch) >= window:
+                submit()
+            yield from ready(window)
+
+        submit()
+        yield from ready(0)
@@ -0,0 +1,158 @@
+import struct
+
+
+# TIFF tags used to locate embedded JPEG previews
+TAG_COMPRESSION = 0x0103
+TAG_STRIP_OFFSETS = 0x0111
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_SUB_IFDS = 0x014A
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+TAG_PANASONIC_JPEG = 0x002E
+
+# TIFF field types and their sizes in bytes
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+
+# Magic numbers of TIFF-based RAW containers: TIFF/NEF/CR2/ARW/DNG..., Olympus ORF, Panasonic RW2
+TIFF_MAGICS = (42, 0x4F52, 0x5352, 0x55)
+
+# Guards against corrupt or looping IFD chains
+MAX_IFDS = 64
+
+JPEG_SOI = b'\xff\xd8'
+
+
+def _read_ifd_values(f, base, endian, typ, count, raw):
+    # Integer values of a SHORT/LONG/IFD entry, inline or behind an offset
+    fmt = {3: 'H', 4: 'I', 13: 'I'}.get(typ)
+    if fmt is None:
+        return []
+    size = TYPE_SIZES[typ] * count
+    if size <= 4:
+        data = raw[:size]
+    else:
+        f.seek(base + struct.unpack(endian + 'I', raw)[0])
+        data = f.read(size)
+    if len(data) < size:
+        return []
+    return list(struct.unpack(endian + fmt * count, data))
+
+
+def _tiff_jpegs(f, base=0):
+    # Return (offset, length) of every JPEG stream referenced from the IFD tree
+    # of the TIFF structure starting at `base`.
+    f.seek(base)
+    header = f.read(8)
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        return []
+    magic, first_ifd = struct.unpack(endian + 'HI', header[2:8])
+    if magic not in TIFF_MAGICS:
+        return []
+
+    found = []
+    to_visit = [first_ifd]
+    seen = set()
+    while to_visit and len(seen) < MAX_IFDS:
+        ifd = to_visit.pop()
+        if ifd == 0 or ifd in seen:
+            continue
+        seen.add(ifd)
+
+        f.seek(base + ifd)
+        count_bytes = f.read(2)
+        if len(count_bytes) < 2:
+            continue
+        (count,) = struct.unpack(endian + 'H', count_bytes)
+        entries = f.read(12 * count)
+        next_ifd = f.read(4)
+
+        tags = {}
+        for i in range(len(entries) // 12):
+            tag, typ, n, raw = struct.unpack(endian + 'HHI4s', entries[12 * i:12 * i + 12])
+            tags[tag] = (typ, n, raw)
+
+        def values(tag):
+            if tag not in tags:
+                return []
+            return _read_ifd_values(f, base, endian, *tags[tag])
+
+        # Previews referenced as a JPEG interchange stream (NEF, CR2, ARW, EXIF IFD1...)
+        offset, length = values(TAG_JPEG_OFFSET), values(TAG_JPEG_LENGTH)
+        if offset and length:
+            found.append((base + offset[0], length[0]))
+
+        # Previews stored as a single JPEG-compressed strip (DNG, some NEF sub-IFDs)
+        if values(TAG_COMPRESSION)[:1] in ([6], [7]):
+            offsets, lengths = values(TAG_STRIP_OFFSETS), values(TAG_STRIP_BYTE_COUNTS)
+            if len(offsets) == 1 and len(lengths) == 1:
+                found.append((base + offsets[0], lengths[0]))
+
+        # Panasonic RW2 keeps a full JPEG as an opaque blob
+        if TAG_PANASONIC_JPEG in tags:
+            typ, n, raw = tags[TAG_PANASONIC_JPEG]
+            if typ == 7 and n > 4:
+                found.append((base + struct.unpack(endian + 'I', raw)[0], n))
+
+        to_visit.extend(values(TAG_SUB_IFDS))
+        if len(next_ifd) == 4:
+            to_visit.append(struct.unpack(endian + 'I', next_ifd)[0])
+
+    return found
+
+
+def _read_jpeg(f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) == length and data.startswith(JPEG_SOI):
+        return data
+    return None
+
+
+def extract_raw_preview(path):
+    # Largest embedded JPEG preview of a RAW file as bytes, or None.
+    # The preview is decoded in draft mode later, so a bigger one costs little
+    # and matches ordinary JPEG exports of the same shot more reliably.
+    with open(path, 'rb') as f:
+        head = f.read(16)
+
+        # Fujifilm RAF: fixed header pointing at the JPEG
+        if head.startswith(b'FUJIFILMCCD-RAW'):
+            f.seek(84)
+            offset, length = struct.unpack('>II', f.read(8))
+            return _read_jpeg(f, offset, length)
+
+        for offset, length in sorted(_tiff_jpegs(f), key=lambda c: -c[1]):
+            data = _read_jpeg(f, offset, length)
+            if data:
+                return data
+    return None
+
+
+def extract_exif_thumbnail(path):
+    # The EXIF thumbnail (IFD1) of a JPEG as bytes, or None if it has none
+    with open(path, 'rb') as f:
+        if f.read(2) != JPEG_SOI:
+            return None
+        while True:
+            marker = f.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                return None
+            kind = marker[1]
+            (length,) = struct.unpack('>H', marker[2:])
+            data_start = f.tell()
+            segment_end = data_start + length - 2
+            # Start of scan: the metadata segments are behind us
+            if kind == 0xDA:
+                return None
+            if kind == 0xE1 and f.read(6) == b'Exif\x00\x00':
+                # Offsets inside the EXIF block are relative to its TIFF header
+                for offset, size in _tiff_jpegs(f, data_start + 6):
+                    data = _read_jpeg(f, offset, size)
+                    if data:
+                        return data
+                return None
+            f.seek(segment_end)
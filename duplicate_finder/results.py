@@ -0,0 +1,321 @@
+import csv
+import json
+import os
+import sqlite3
+import time
+
+from PIL import Image
+
+from duplicate_finder.hash_index import FileStat
+from duplicate_finder.hashing import open_source
+
+
+# Bump whenever the tables below change; older result sets are dropped
+SCHEMA_VERSION = 1
+
+DEFAULT_RESULTS_NAME = ".scan_results.sqlite3"
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+# Columns of a CSV export, one row per file in a group
+CSV_COLUMNS = ('group', 'match', 'reclaimable_bytes', 'path', 'size', 'width', 'height')
+
+
+def default_results_path():
+    # Lives next to the hash cache
+    return os.path.join(os.getcwd(), DEFAULT_RESULTS_NAME)
+
+
+def image_dimensions(path):
+    # (width, height) read from the image header, without decoding; RAW files
+    # report their embedded preview. None when the file cannot be opened.
+    try:
+        with Image.open(open_source(path)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+class ResultStore:
+    # Scan results in SQLite, one result set ("run") per scan. Files are
+    # recorded as they are hashed and groups as they are formed, so a result
+    # set can be reopened later without scanning, and exported without
+    # loading it into memory. Like HashCache, a store is bound to the thread
+    # that opened it.
+    #
+    # Only the latest finished run per set of roots is kept; a cancelled run
+    # is dropped, since it has no groups. A run that could not list one of
+    # its roots is kept as "incomplete" next to the earlier results, which it
+    # does not replace, until the next scan of those roots.
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_results_path()
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            for table in ("runs", "files", "groups", "members"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY,"
+            " roots TEXT NOT NULL,"
+            " threshold INTEGER NOT NULL,"
+            " use_exif_thumbnails INTEGER NOT NULL,"
+            " started REAL NOT NULL,"
+            " finished REAL,"
+            " status TEXT NOT NULL)"
+        )
+        # Every file the scan looked at: stat fields and hash record, or the
+        # error it failed with. Exact copies point at the file they copy.
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " run INTEGER NOT NULL,"
+            " path TEXT NOT NULL,"
+            " size INTEGER,"
+            " mtime_ns INTEGER,"
+            " inode INTEGER,"
+            " hashes TEXT,"
+            " copy_of TEXT,"
+            " error TEXT,"
+            " PRIMARY KEY (run, path))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS groups ("
+            " run INTEGER NOT NULL,"
+            " gid INTEGER NOT NULL,"
+            " match TEXT NOT NULL,"
+            " files INTEGER NOT NULL,"
+            " total_bytes INTEGER NOT NULL,"
+            " reclaimable_bytes INTEGER NOT NULL,"
+            " PRIMARY KEY (run, gid))"
+        )
+        # Files of each group in display order; the first one is the one kept
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS members ("
+            " run INTEGER NOT NULL,"
+            " gid INTEGER NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " path TEXT NOT NULL,"
+            " width INTEGER,"
+            " height INTEGER,"
+            " PRIMARY KEY (run, gid, seq))"
+        )
+        self.conn.commit()
+        self.run = None
+        self.pending = 0
+
+
+    def start_run(self, roots, threshold, use_exif_thumbnails=False):
+        # Runs of the same roots left unfinished by a crash, or incomplete,
+        # are of no further use
+        key = "\n".join(roots)
+        for (run,) in self.conn.execute(
+            "SELECT id FROM runs WHERE roots = ? AND status IN ('running', 'incomplete')", (key,)
+        ).fetchall():
+            self._delete_run(run)
+        self.run = self.conn.execute(
+            "INSERT INTO runs (roots, threshold, use_exif_thumbnails, started, status)"
+            " VALUES (?, ?, ?, ?, 'running')",
+            (key, threshold, int(use_exif_thumbnails), time.time())
+        ).lastrowid
+        self.commit()
+        return self.run
+
+
+    def find_run(self, roots=None, run=None):
+        # Settings of result set `run` (finished or incomplete), or of the
+        # latest finished scan of `roots` (of any roots when none are given),
+        # as a dict. Selects it for the methods below. Raises ValueError when
+        # there is none.
+        query = "SELECT id, roots, threshold, use_exif_thumbnails, started, finished FROM runs WHERE"
+        if run is not None:
+            row = self.conn.execute(
+                query + " status IN ('done', 'incomplete') AND id = ?", (run,)
+            ).fetchone()
+        elif roots:
+            row = self.conn.execute(
+                query + " status = 'done' AND roots = ? ORDER BY finished DESC LIMIT 1", ("\n".join(roots),)
+            ).fetchone()
+        else:
+            row = self.conn.execute(query + " status = 'done' ORDER BY finished DESC LIMIT 1").fetchone()
+        if row is None:
+            if run is not None:
+                raise ValueError(f"No saved results with id {run} in {self.db_path}")
+            where = f" for {', '.join(roots)}" if roots else ""
+            raise ValueError(f"No saved results{where} in {self.db_path}")
+
+        self.run = row[0]
+        return {
+            'run': row[0],
+            'roots': row[1].split("\n"),
+            'threshold': row[2],
+            'use_exif_thumbnails': bool(row[3]),
+            'started': row[4],
+            'finished': row[5],
+        }
+
+
+    def add_file(self, path, st, hashes=None, copy_of=None, error=None):
+        # Record (or replace) a file of the current run
+        size, mtime_ns, inode = (st.st_size, st.st_mtime_ns, st.st_ino) if st is not None else (None, None, None)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (run, path, size, mtime_ns, inode, hashes, copy_of, error)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.run, path, size, mtime_ns, inode, hashes, copy_of, error)
+        )
+        # Commit in batches, as the hash cache does
+        self.pending += 1
+        if self.pending >= 500:
+            self.commit()
+
+
+    def remove_file(self, path):
+        self.conn.execute("DELETE FROM files WHERE run = ? AND path = ?", (self.run, path))
+
+
+    def set_group(self, gid, match, paths, known=None):
+        # Save group `gid` (or delete it when `paths` is empty) and return its
+        # details: file sizes, dimensions and the bytes freed by deleting all
+        # files but the first. `known` holds the (width, height) of each path
+        # where already known, e.g. from the hash cache; only paths without
+        # one (None) have their image header read.
+        self.conn.execute("DELETE FROM members WHERE run = ? AND gid = ?", (self.run, gid))
+        self.conn.execute("DELETE FROM groups WHERE run = ? AND gid = ?", (self.run, gid))
+        if not paths:
+            return {'sizes': [], 'dimensions': [], 'reclaimable': 0}
+
+        sizes = []
+        dimensions = []
+        for seq, path in enumerate(paths):
+            row = self.conn.execute(
+                "SELECT size FROM files WHERE run = ? AND path = ?", (self.run, path)
+            ).fetchone()
+            sizes.append(row[0] if row and row[0] is not None else 0)
+            size = known[seq] if known else None
+            if size is None:
+                size = image_dimensions(path)
+            dimensions.append(list(size) if size else None)
+            self.conn.execute(
+                "INSERT INTO members (run, gid, seq, path, width, height) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.run, gid, seq, path, *(size or (None, None)))
+            )
+        reclaimable = sum(sizes) - sizes[0]
+        self.conn.execute(
+            "INSERT INTO groups (run, gid, match, files, total_bytes, reclaimable_bytes)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self.run, gid, match, len(paths), sum(sizes), reclaimable)
+        )
+        return {'sizes': sizes, 'dimensions': dimensions, 'reclaimable': reclaimable}
+
+
+    def finish(self, status='done'):
+        # Close the current run. A finished run replaces earlier results for
+        # the same roots; an incomplete one is kept beside them; a cancelled
+        # one is discarded.
+        if status == 'incomplete':
+            self.conn.execute(
+                "UPDATE runs SET finished = ?, status = 'incomplete' WHERE id = ?", (time.time(), self.run)
+            )
+            self.commit()
+            return
+        if status != 'done':
+            self._delete_run(self.run)
+            self.commit()
+            return
+        (key,) = self.conn.execute("SELECT roots FROM runs WHERE id = ?", (self.run,)).fetchone()
+        for (run,) in self.conn.execute(
+            "SELECT id FROM runs WHERE roots = ? AND id != ?", (key, self.run)
+        ).fetchall():
+            self._delete_run(run)
+        self.conn.execute(
+            "UPDATE runs SET finished = ?, status = 'done' WHERE id = ?", (time.time(), self.run)
+        )
+        self.commit()
+
+
+    def _delete_run(self, run):
+        for table in ("members", "groups", "files"):
+            self.conn.execute(f"DELETE FROM {table} WHERE run = ?", (run,))
+        self.conn.execute("DELETE FROM runs WHERE id = ?", (run,))
+
+
+    def files(self):
+        # (path, FileStat, hash record, copy_of) of every file of the current
+        # run that was hashed or found to be an exact copy
+        rows = self.conn.execute(
+            "SELECT path, size, mtime_ns, inode, hashes, copy_of FROM files"
+            " WHERE run = ? AND error IS NULL",
+            (self.run,)
+        )
+        for path, size, mtime_ns, inode, hashes, copy_of in rows:
+            yield path, FileStat(size, mtime_ns, inode), hashes, copy_of
+
+
+    def groups(self):
+        # Groups of the current run in id order, as (gid, match, paths, details)
+        # with details as returned by set_group
+        rows = self.conn.execute(
+            "SELECT g.gid, g.match, g.reclaimable_bytes, m.path, f.size, m.width, m.height"
+            " FROM groups g"
+            " JOIN members m ON m.run = g.run AND m.gid = g.gid"
+            " LEFT JOIN files f ON f.run = m.run AND f.path = m.path"
+            " WHERE g.run = ? ORDER BY g.gid, m.seq",
+            (self.run,)
+        )
+        current = None
+        for gid, match, reclaimable, path, size, width, height in rows:
+            if current is None or current[0] != gid:
+                if current is not None:
+                    yield current
+                current = (gid, match, [], {'sizes': [], 'dimensions': [], 'reclaimable': reclaimable})
+            current[2].append(path)
+            current[3]['sizes'].append(size or 0)
+            current[3]['dimensions'].append([width, height] if width is not None else None)
+        if current is not None:
+            yield current
+
+
+    def group_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM groups WHERE run = ?", (self.run,)).fetchone()[0]
+
+
+    def file_count(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM files WHERE run = ? AND error IS NULL", (self.run,)
+        ).fetchone()[0]
+
+
+    def export(self, out, fmt='jsonl'):
+        # Write the groups of the current run to the text stream `out`, one at
+        # a time: JSON lines (one object per group, same fields as "group"
+        # events) or CSV (one row per file). Returns the number of groups.
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        writer = None
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(CSV_COLUMNS)
+        count = 0
+        for gid, match, paths, details in self.groups():
+            count += 1
+            if writer is None:
+                out.write(json.dumps({'group': gid, 'match': match, 'paths': paths, **details}) + "\n")
+                continue
+            for path, size, dims in zip(paths, details['sizes'], details['dimensions']):
+                writer.writerow((gid, match, details['reclaimable'], path, size, *(dims or ('', ''))))
+        return count
+
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import time
+from array import array
+
+import numpy as np
+
+from duplicate_finder.grouping import DEFAULT_THRESHOLD, group_indices, merge_exact_groups
+from duplicate_finder.hash_index import PathTable
+from duplicate_finder.hashing import HASH_KINDS
+
+
+# Bump whenever the layout of a shard file changes
+SHARD_VERSION = 1
+
+
+def default_node():
+    return socket.gethostname()
+
+
+def write_shard(engine, path, node=None):
+    # Save the state of a finished scan as a portable index shard: paths, stat
+    # fields, the packed hashes of every hashed file and which files are
+    # byte-identical copies of another. Shards from different machines can be
+    # merged without touching the images again.
+    files, index = engine.files, engine.index
+    copy_of = np.full(len(files), -1, dtype=np.int64)
+    for grp in engine.exact_groups:
+        copy_of[grp[1:]] = grp[0]
+
+    meta = {
+        'version': SHARD_VERSION,
+        'node': node or default_node(),
+        'roots': engine.roots,
+        'created': time.time(),
+        'use_exif_thumbnails': engine.use_exif_thumbnails,
+    }
+    arrays = {
+        'meta': np.array(json.dumps(meta)),
+        'path_data': np.frombuffer(bytes(files.paths.data), dtype=np.uint8),
+        'path_offsets': np.frombuffer(files.paths.offsets, dtype=np.int64),
+        'sizes': np.frombuffer(files.sizes, dtype=np.int64),
+        'mtimes': np.frombuffer(files.mtimes, dtype=np.int64),
+        'hash_ids': np.frombuffer(index.ids, dtype=np.int64),
+        'copy_of': copy_of,
+    }
+    for kind in HASH_KINDS:
+        arrays[kind] = np.frombuffer(index.values[kind], dtype=np.uint64)
+
+    # Written through a file object so numpy does not append ".npz" to the name
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, path)
+
+
+class Shard:
+    # Read-only view of a shard file
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(path, allow_pickle=False) as data:
+            self.meta = json.loads(str(data['meta']))
+            if self.meta.get('version') != SHARD_VERSION:
+                raise ValueError(f"{path}: unsupported shard version {self.meta.get('version')}")
+            self.paths = PathTable()
+            self.paths.data = bytearray(data['path_data'].tobytes())
+            self.paths.offsets = array('q', data['path_offsets'].tobytes())
+            self.sizes = data['sizes']
+            self.mtimes = data['mtimes']
+            self.hash_ids = data['hash_ids']
+            self.copy_of = data['copy_of']
+            self.values = {kind: data[kind] for kind in HASH_KINDS}
+        self.node = self.meta['node']
+
+
+    def __len__(self):
+        return len(self.sizes)
+
+
+    def exact_groups(self):
+        # Byte-identical copies found by the scan, representative first
+        groups = {}
+        for copy in np.flatnonzero(self.copy_of >= 0).tolist():
+            groups.setdefault(int(self.copy_of[copy]), []).append(copy)
+        return [[rep] + copies for rep, copies in groups.items()]
+
+
+def merge_shards(shards, threshold=DEFAULT_THRESHOLD, kind='phash'):
+    # Cross-shard duplicate groups from shard files alone. Returns (groups,
+    # matches) with each group a list of (node, path) pairs. "exact" groups
+    # are copies verified byte for byte within one shard; identical images on
+    # different nodes come out as "perceptual" groups at distance 0.
+    shards = [shard if isinstance(shard, Shard) else Shard(shard) for shard in shards]
+    if len({shard.meta['use_exif_thumbnails'] for shard in shards}) > 1:
+        raise ValueError("Cannot merge shards scanned with and without EXIF thumbnails")
+
+    # Shard-local ids become global ids by offsetting each shard's ids
+    offsets = np.cumsum([0] + [len(shard) for shard in shards])
+    ids = np.concatenate([shard.hash_ids + offset for shard, offset in zip(shards, offsets)])
+    values = np.concatenate([shard.values[kind] for shard in shards])
+    perceptual = [ids[members].tolist() for members in group_indices(values, threshold)]
+    exact = [
+        [i + int(offset) for i in grp]
+        for shard, offset in zip(shards, offsets)
+        for grp in shard.exact_groups()
+    ]
+    groups, matches = merge_exact_groups(perceptual, exact)
+
+    def locate(i):
+        s = int(np.searchsorted(offsets, i, side='right')) - 1
+        return shards[s].node, shards[s].paths[i - int(offsets[s])]
+
+    return [[locate(i) for i in grp] for grp in groups], matches
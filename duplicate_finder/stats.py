@@ -0,0 +1,195 @@
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from duplicate_finder.formats import ext_group
+
+
+DEFAULT_REPORT_NAME = "scan_report.json"
+
+# Slowest files kept for the report
+SLOWEST_FILES = 20
+
+# Stages in the order they appear in the report. read is summed over the
+# prefetch threads, open/decode/hash over all files in the worker processes.
+STAGES = ('walk', 'cache', 'exact', 'read', 'open', 'decode', 'hash', 'group', 'results')
+
+
+def default_report_path():
+    # Written next to duplicate_log.jsonl
+    return os.path.join(os.getcwd(), DEFAULT_REPORT_NAME)
+
+
+def peak_rss():
+    # Peak resident set size in bytes of this process and of its largest
+    # child (the hashing workers), or None where it cannot be measured
+    try:
+        import resource
+    except ImportError:
+        return {'self': _windows_peak_rss(), 'children': None}
+
+    # ru_maxrss is in KiB on Linux but in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+def _windows_peak_rss():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except Exception:
+        pass
+    return None
+
+
+class ScanStats:
+    # Per-stage wall/CPU time, per-format throughput, peak memory and the
+    # slowest files of one scan. Stages timed on different threads may be
+    # recorded concurrently.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {stage: [0.0, 0.0] for stage in STAGES}
+        self.formats = {}
+        self.slowest = []
+        self.counts = {'files': 0, 'hashed': 0, 'cached': 0, 'exact_copies': 0, 'errors': 0}
+
+
+    def add_stage(self, stage, wall, cpu):
+        with self.lock:
+            totals = self.stages[stage]
+            totals[0] += wall
+            totals[1] += cpu
+
+
+    @contextmanager
+    def stage(self, name):
+        # CPU time is this thread's only, so concurrent stages don't overlap
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+    def record_file(self, path, size, timing):
+        # Worker-side timings of one decoded file
+        seconds = 0.0
+        for stage, (wall, cpu) in timing.items():
+            self.add_stage(stage, wall, cpu)
+            seconds += wall
+
+        with self.lock:
+            fmt = self.formats.setdefault(ext_group(path), {'files': 0, 'bytes': 0, 'seconds': 0.0})
+            fmt['files'] += 1
+            fmt['bytes'] += size
+            fmt['seconds'] += seconds
+
+            # Min-heap of the slowest files seen so far
+            entry = (seconds, path)
+            if len(self.slowest) < SLOWEST_FILES:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        formats = {}
+        for name, fmt in sorted(self.formats.items()):
+            seconds = fmt['seconds']
+            formats[name] = {
+                'files': fmt['files'],
+                'bytes': fmt['bytes'],
+                'busy_seconds': round(seconds, 3),
+                # Per worker: divide by busy time, not by the scan's wall time
+                'files_per_sec': round(fmt['files'] / seconds, 1) if seconds else None,
+                'mb_per_sec': round(fmt['bytes'] / 1e6 / seconds, 2) if seconds else None,
+            }
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'counts': dict(self.counts),
+            'files_per_sec': round(self.counts['files'] / elapsed, 1) if elapsed else None,
+            'stages': {
+                stage: {'wall_seconds': round(wall, 3), 'cpu_seconds': round(cpu, 3)}
+                for stage, (wall, cpu) in self.stages.items()
+            },
+            'formats': formats,
+            'peak_rss_bytes': peak_rss(),
+            'slowest_files': [
+                {'path': path, 'seconds': round(seconds, 4)}
+                for seconds, path in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def format_report(report):
+    # Plain-text summary for the GUI
+    lines = [
+        f"Elapsed: {report['elapsed_seconds']:.1f} s "
+        f"({report['counts']['files']:,} files, {report['files_per_sec'] or 0:,} files/s)",
+        "Files: " + ", ".join(f"{key} {value:,}" for key, value in report['counts'].items()),
+        "",
+        "Stage        wall s     cpu s",
+    ]
+    for stage, times in report['stages'].items():
+        lines.append(f"{stage:<10} {times['wall_seconds']:>8.2f}  {times['cpu_seconds']:>8.2f}")
+
+    lines += ["", "Format     files      MB   files/s   MB/s"]
+    for name, fmt in report['formats'].items():
+        lines.append(
+            f"{name:<8} {fmt['files']:>7,} {fmt['bytes'] / 1e6:>7.1f} "
+            f"{fmt['files_per_sec'] or 0:>9} {fmt['mb_per_sec'] or 0:>6}"
+        )
+
+    rss = report['peak_rss_bytes']
+    lines += ["", "Peak RSS: " + ", ".join(
+        f"{who} {value / 1e6:.0f} MB" for who, value in rss.items() if value is not None
+    )]
+
+    lines += ["", "Slowest files:"]
+    lines += [f"  {entry['seconds']:.3f} s  {entry['path']}" for entry in report['slowest_files']]
+    return "\n".join(lines)
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+
+from PIL import Image
+
+from duplicate_finder.hashing import open_source
+
+
+DEFAULT_THUMB_DIR_NAME = ".thumb_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def default_thumb_dir():
+    # Lives next to the app's .trash directory
+    return os.path.join(os.getcwd(), DEFAULT_THUMB_DIR_NAME)
+
+
+def make_thumbnail(path, size):
+    # Thumbnail ready for ImageTk; RAW files use their embedded preview.
+    # Image.thumbnail() uses JPEG draft mode, so big JPEGs are never fully decoded.
+    with Image.open(open_source(path)) as img:
+        img.thumbnail(size)
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        img.load()
+        return img
+
+
+class ThumbnailCache:
+    # Generated thumbnails stored as small PNGs named after the source file's
+    # path, size and mtime, so edited files get a fresh thumbnail. Each hit
+    # bumps the PNG's mtime, and the least recently used ones are deleted once
+    # the directory grows past max_bytes. Safe to use from several threads.
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_thumb_dir()
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith('.png')
+        )
+
+
+    def _entry(self, path, size):
+        st = os.stat(path)
+        key = f"{path}\0{st.st_size}\0{st.st_mtime_ns}\0{size[0]}x{size[1]}"
+        digest = hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.directory, digest + '.png')
+
+
+    def load(self, path, size):
+        entry = self._entry(path, size)
+        try:
+            with Image.open(entry) as img:
+                img.load()
+            # The file's mtime is the LRU clock
+            os.utime(entry)
+            return img
+        except OSError:
+            pass
+
+        img = make_thumbnail(path, size)
+        self._store(entry, img)
+        return img
+
+
+    def _store(self, entry, img):
+        # Write under a temporary name so readers never see half a file
+        tmp = f"{entry}.{threading.get_ident()}.tmp"
+        try:
+            img.save(tmp, 'PNG')
+            os.replace(tmp, entry)
+        except OSError:
+            return
+        with self.lock:
+            self.total_bytes += os.path.getsize(entry)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+
+    def _evict(self):
+        # Trim to 90% of the limit so eviction does not run on every store
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except OSError:
+                pass
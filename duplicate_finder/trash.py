@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+
+# The app's own trash folder, in the working directory
+DEFAULT_TRASH_NAME = ".trash"
+
+# Trash folder created at the top of other filesystems, so files are renamed
+# into it rather than copied across devices
+TRASH_DIR_NAME = ".duplicate_trash"
+
+DEFAULT_JOURNAL_NAME = ".trash_journal.jsonl"
+
+
+def default_journal_path():
+    # Next to the app's .trash directory
+    return os.path.join(os.getcwd(), DEFAULT_JOURNAL_NAME)
+
+
+class TrashManager:
+    # Moves files into a trash folder on their own filesystem with os.rename,
+    # and keeps an append-only journal of every move so any number of
+    # deletions can be undone, newest first, even after a restart.
+    #
+    # Journal lines (JSON):
+    #   {"op": "trash", "batch", "time", "from", "to"}   one per file moved
+    #   {"op": "restore", "batch", "to"}                 file moved back out
+    # Emptying the trash truncates the journal.
+    #
+    # Methods run synchronously; run them on a worker thread and pass a
+    # progress(done, total) callback to keep a UI responsive.
+
+    def __init__(self, default_dir, journal_path=None):
+        self.default_dir = os.path.abspath(default_dir)
+        self.journal_path = journal_path or default_journal_path()
+        self.dirs = {}
+        os.makedirs(self.default_dir, exist_ok=True)
+
+
+    def _trash_dir(self, path):
+        # Trash folder on the same device as `path`: the default one if it
+        # qualifies, else TRASH_DIR_NAME in the highest writable folder of
+        # that filesystem. None when there is no such folder.
+        directory = os.path.dirname(os.path.abspath(path))
+        dev = os.stat(directory).st_dev
+        if dev in self.dirs:
+            return self.dirs[dev]
+
+        if os.stat(self.default_dir).st_dev == dev:
+            self.dirs[dev] = self.default_dir
+            return self.default_dir
+
+        chain = [directory]
+        while True:
+            parent = os.path.dirname(chain[-1])
+            if parent == chain[-1] or os.stat(parent).st_dev != dev:
+                break
+            chain.append(parent)
+
+        for top in reversed(chain):
+            candidate = os.path.join(top, TRASH_DIR_NAME)
+            try:
+                os.makedirs(candidate, exist_ok=True)
+            except OSError:
+                continue
+            if os.access(candidate, os.W_OK):
+                self.dirs[dev] = candidate
+                return candidate
+        self.dirs[dev] = None
+        return None
+
+
+    def _replay(self):
+        # Batches that can still be undone, oldest first, as
+        # [(batch, [(original, trashed), ...]), ...]
+        batches = {}
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-write
+                        continue
+                    if entry['op'] == 'trash':
+                        batches.setdefault(entry['batch'], {})[entry['to']] = entry['from']
+                    elif entry['op'] == 'restore':
+                        batches.get(entry['batch'], {}).pop(entry['to'], None)
+        except FileNotFoundError:
+            return []
+        return [
+            (batch, [(original, trashed) for trashed, original in moves.items()])
+            for batch, moves in batches.items() if moves
+        ]
+
+
+    def undo_levels(self):
+        return len(self._replay())
+
+
+    def _journal(self):
+        return open(self.journal_path, 'a', encoding='utf-8')
+
+
+    def trash(self, paths, progress=None):
+        # Move `paths` to the trash as one undoable batch.
+        # Returns ([(original, trashed), ...], [(path, error message), ...]).
+        batch = uuid.uuid4().hex[:12]
+        moved, errors = [], []
+        with self._journal() as journal:
+            for n, path in enumerate(paths, 1):
+                try:
+                    target_dir = self._trash_dir(path)
+                    # Unique by construction, so no probing for free names
+                    name = f"{batch}-{n}-{os.path.basename(path)}"
+                    if target_dir is not None:
+                        trashed = os.path.join(target_dir, name)
+                        os.rename(path, trashed)
+                    else:
+                        # No writable folder on that filesystem; fall back to copying
+                        trashed = os.path.join(self.default_dir, name)
+                        shutil.move(path, trashed)
+                except OSError as e:
+                    errors.append((path, str(e)))
+                else:
+                    moved.append((path, trashed))
+                    # Flushed line by line, so a crash loses at most the entry of the move in progress
+                    journal.write(json.dumps({
+                        'op': 'trash', 'batch': batch, 'time': time.time(),
+                        'from': path, 'to': trashed,
+                    }) + "\n")
+                    journal.flush()
+                if progress:
+                    progress(n, len(paths))
+            os.fsync(journal.fileno())
+        return moved, errors
+
+
+    def undo(self, progress=None):
+        # Restore the most recent batch still in the trash.
+        # Returns ([(original, trashed), ...], [(path, error message), ...]).
+        batches = self._replay()
+        if not batches:
+            return [], []
+        batch, moves = batches[-1]
+        restored, errors = [], []
+        with self._journal() as journal:
+            for n, (original, trashed) in enumerate(moves, 1):
+                try:
+                    os.makedirs(os.path.dirname(original), exist_ok=True)
+                    if os.path.exists(original):
+                        raise FileExistsError(f"{original} already exists")
+                    try:
+                        os.rename(trashed, original)
+                    except OSError:
+                        # Fallback copy across devices
+                        shutil.move(trashed, original)
+                except OSError as e:
+                    errors.append((original, str(e)))
+                else:
+                    restored.append((original, trashed))
+                    journal.write(json.dumps({'op': 'restore', 'batch': batch, 'to': trashed}) + "\n")
+                    journal.flush()
+                if progress:
+                    progress(n, len(moves))
+            os.fsync(journal.fileno())
+        return restored, errors
+
+
+    def trash_dirs(self):
+        # Every trash folder in use: the default one and those named in the journal
+        dirs = {self.default_dir}
+        for _, moves in self._replay():
+            dirs.update(os.path.dirname(trashed) for _, trashed in moves)
+        dirs.update(d for d in self.dirs.values() if d)
+        return sorted(dirs)
+
+
+    def count(self):
+        total = 0
+        for directory in self.trash_dirs():
+            try:
+                total += len(os.listdir(directory))
+            except OSError:
+                continue
+        return total
+
+
+    def empty(self, progress=None):
+        # Permanently delete everything in every trash folder; nothing can be
+        # undone afterwards. Returns (deleted count, [(path, error message), ...]).
+        entries = []
+        for directory in self.trash_dirs():
+            try:
+                with os.scandir(directory) as it:
+                    entries.extend(entry.path for entry in it)
+            except OSError:
+                continue
+
+        deleted, errors = 0, []
+        for n, path in enumerate(entries, 1):
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                deleted += 1
+            except OSError as e:
+                errors.append((path, str(e)))
+            if progress:
+                progress(n, len(entries))
+
+        # The journal only describes what is in the trash, which is now nothing
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        return deleted, errors
@@ -0,0 +1,57 @@
+import os
+
+from duplicate_finder.thumb_cache import DEFAULT_THUMB_DIR_NAME
+from duplicate_finder.trash import DEFAULT_TRASH_NAME, TRASH_DIR_NAME
+
+
+# Folders the app writes into itself. They are never scanned or watched, so
+# trashed files do not come back as duplicates of the files they duplicated,
+# nor preview thumbnails as near-duplicates of every previewed image.
+SKIP_DIRS = frozenset((DEFAULT_TRASH_NAME, TRASH_DIR_NAME, DEFAULT_THUMB_DIR_NAME))
+
+
+def walk_images(root, exts, unlisted=None):
+    # Yield (path, stat, None) for every file under root whose name ends with
+    # one of `exts`, or (path, None, error message) when it cannot be stat'ed.
+    # Uses os.scandir so directory entries are typed without extra syscalls
+    # (and on Windows, size and mtime come with the listing). Like
+    # os.walk, symlinked directories are not followed, and neither are the
+    # app's own folders (SKIP_DIRS). A directory that cannot be listed
+    # (root included) comes out as (directory, None, error message) and is
+    # added to the set `unlisted`, so callers do not take its files for gone.
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            it = os.scandir(directory)
+        except OSError as e:
+            if unlisted is not None:
+                unlisted.add(directory)
+            yield directory, None, str(e)
+            continue
+
+        subdirs = []
+        with it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if entry.name not in SKIP_DIRS:
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith(exts):
+                    try:
+                        st = entry.stat()
+                        if not st.st_ino:
+                            # Windows listings carry no file index; the stat is the
+                            # cache key, and everything else compares it against
+                            # os.stat(), so take that one
+                            st = os.stat(entry.path)
+                    except OSError as e:
+                        yield entry.path, None, str(e)
+                        continue
+                    yield entry.path, st, None
+
+        # Visit subdirectories in listing order, like os.walk
+        stack.extend(reversed(subdirs))
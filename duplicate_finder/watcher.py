@@ -0,0 +1,217 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from duplicate_finder.walker import SKIP_DIRS
+
+
+# inotify event bits, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONTFOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONTFOLLOW
+)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# A burst of changes is collected until nothing new arrives for SETTLE_SECONDS
+# (files still being copied keep producing events), but for no longer than
+# MAX_BATCH_SECONDS, so a long copy still shows up progressively
+SETTLE_SECONDS = 0.5
+MAX_BATCH_SECONDS = 3.0
+
+
+class Changes:
+    # One batch of changes under the watched roots. `changed` and `removed`
+    # are image paths; `removed_dirs` are directories that disappeared with
+    # everything in them; `rescan` means events were lost and the caller has
+    # to compare the whole tree again.
+
+    def __init__(self):
+        self.changed = set()
+        self.removed = set()
+        self.removed_dirs = set()
+        self.rescan = False
+
+
+    def __bool__(self):
+        return bool(self.changed or self.removed or self.removed_dirs or self.rescan)
+
+
+class InotifyWatcher:
+    # Recursive watch over directory trees with Linux inotify, via ctypes.
+    # Blocks in select() between events, so an idle watch costs no CPU.
+    # Raises OSError when inotify is unavailable or out of watches; callers
+    # fall back to polling then. Running out of watches later, for a new
+    # folder, asks for a rescan and sets `failed` to the error, after which
+    # callers should switch to polling too.
+
+    backend = 'inotify'
+    failed = None
+
+    def __init__(self, roots, exts):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        self.exts = exts
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.dirs = {}
+        try:
+            for root in roots:
+                self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+
+    def _watch(self, directory):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), WATCH_MASK
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno in (2, 13, 20):
+                # ENOENT / EACCES / ENOTDIR: gone or unreadable, like the walk skips it
+                return
+            raise OSError(errno, f"inotify_add_watch {directory}: {os.strerror(errno)}")
+        self.dirs[wd] = directory
+
+
+    def _watch_tree(self, top, found=None):
+        # Watch `top` and every directory below it. Images already inside
+        # (e.g. a folder moved in) are added to `found`.
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            self._watch(directory)
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in SKIP_DIRS:
+                                    stack.append(entry.path)
+                            elif found is not None and entry.name.lower().endswith(self.exts):
+                                found.add(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+
+    def _read(self, changes):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                changes.rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue
+            path = os.path.join(directory, name)
+
+            if mask & IN_ISDIR:
+                if name in SKIP_DIRS:
+                    # Never watched, so nothing inside it was ever reported
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._watch_tree(path, changes.changed)
+                    except OSError as e:
+                        # Out of watches (ENOSPC) or kernel memory: the new
+                        # folder is only partly watched
+                        self.failed = str(e)
+                        changes.rescan = True
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changes.removed_dirs.add(path)
+                    # Watches of a directory moved elsewhere stay active; drop them
+                    prefix = os.path.join(path, '')
+                    for stale in [w for w, d in self.dirs.items() if d == path or d.startswith(prefix)]:
+                        self.libc.inotify_rm_watch(self.fd, stale)
+                        del self.dirs[stale]
+            elif name.lower().endswith(self.exts):
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    changes.changed.add(path)
+                    changes.removed.discard(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changes.removed.add(path)
+                    changes.changed.discard(path)
+        return True
+
+
+    def wait(self, timeout):
+        # Block up to `timeout` seconds for changes, then collect the whole burst
+        changes = Changes()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changes
+        deadline = time.monotonic() + MAX_BATCH_SECONDS
+        while self._read(changes) or select.select([self.fd], [], [], SETTLE_SECONDS)[0]:
+            if time.monotonic() >= deadline:
+                break
+        return changes
+
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    # Fallback for platforms and filesystems without inotify (network shares,
+    # Windows, macOS): asks the caller to compare the tree every `interval` seconds
+
+    backend = 'polling'
+    failed = None
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_poll = time.monotonic() + interval
+
+
+    def wait(self, timeout):
+        changes = Changes()
+        now = time.monotonic()
+        if now < self.next_poll:
+            time.sleep(min(timeout, self.next_poll - now))
+        if time.monotonic() >= self.next_poll:
+            self.next_poll = time.monotonic() + self.interval
+            changes.rescan = True
+        return changes
+
+
+    def close(self):
+        pass
@@ -1,5 +1,7 @@
 import os
 import platform
+import json
+import time
 try:
     import win32com.client # type: ignore
 except ImportError:
@@ -7,37 +9,31 @@ except ImportError:
 from tkinter import (
     Tk, Button, Label, filedialog, Listbox, END,
     Checkbutton, BooleanVar, Toplevel, messagebox,
-    Canvas, Frame, Scrollbar
+    Canvas, Frame, Scrollbar, Spinbox, IntVar, PhotoImage, Text
 )
-from PIL import Image, ImageTk
-import imagehash
-import shutil
+from PIL import ImageTk
 import threading
 import queue
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+from duplicate_finder.engine import ScanEngine
+from duplicate_finder.grouping import DEFAULT_THRESHOLD, MAX_THRESHOLD
+from duplicate_finder.hashing import default_workers
+from duplicate_finder.prefetch import DEFAULT_IO_WORKERS
+from duplicate_finder.stats import format_report
+from duplicate_finder.thumb_cache import ThumbnailCache
+from duplicate_finder.trash import DEFAULT_TRASH_NAME, TrashManager
 
-# Defining and grouping image file extension tuples
-RASTER_EXTS = (
-    '.png', '.apng', '.jpg', '.jpeg', '.jpe', '.jfif', '.pjpeg', '.pjp',
-    '.bmp', '.dib', '.gif', '.tiff', '.tif', '.webp', '.heif', '.heic',
-    '.avif', '.jp2', '.j2k', '.jpf', '.jpx', '.jpm', '.mj2', '.jxr', '.hdp',
-    '.wdp', '.exr', '.hdr', '.psd', '.psb', '.ico', '.cur', '.xbm', '.xpm',
-    '.pcx', '.tga', '.dds', '.ras', '.sgi', '.rgb', '.rgba', '.pic', '.pct',
-    '.mng', '.jng', '.bpg', '.flif', '.qoi', '.pam', '.pbm', '.pgm', '.ppm', '.pnm',
-)
-VECTOR_EXTS = (
-    '.svg', '.svgz', '.eps', '.ps', '.ai', '.pdf', '.cdr', '.wmf', '.emf',
-    '.dxf', '.cgm', '.vml',
-)
-RAW_EXTS = (
-    '.3fr', '.ari', '.arw', '.srf', '.sr2', '.bay', '.braw', '.cri',
-    '.crw', '.cr2', '.cr3', '.cap', '.iiq', '.eip', '.dcs', '.dcr',
-    '.drf', '.k25', '.kdc', '.dng', '.erf', '.fff', '.gpr', '.mef',
-    '.mdc', '.mos', '.mrw', '.nef', '.nrw', '.orf', '.pef', '.ptx',
-    '.pxn', '.r3d', '.raf', '.raw', '.rw2', '.rwl', '.rwz', '.srw',
-    '.tco', '.x3f',
-)
-ALL_IMAGE_EXTS = RASTER_EXTS + VECTOR_EXTS + RAW_EXTS
+
+# Preview layout: each thumbnail cell and each row of group frames has a fixed size
+PREVIEW_THUMB_SIZE = 100
+PREVIEW_CELL_W = PREVIEW_THUMB_SIZE + 10
+PREVIEW_GROUP_PAD = 34
+PREVIEW_ROW_H = PREVIEW_THUMB_SIZE + 70
+PREVIEW_WORKERS = 4
+PREVIEW_MAX_PHOTOS = 2000
 
 
 class DuplicateImageFinder:
@@ -50,9 +46,19 @@ class DuplicateImageFinder:
         self.deletion_paths = []
         self.last_folder = None
         self.duplicate_groups = []
+        self.group_matches = []
+        self.scan_engine = None
+        self.scan_worker = None
+        self.scan_polling = False
+        # Bumped for every scan; scan_queue messages of older scans are dropped
+        self.scan_generation = 0
+        self.retired_workers = []
+        self.revalidating = False
 
         self.root = root
         self.root.title("Duplicate Image Finder")
+        # Closing the window mid-scan checkpoints the scan first
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
         self.label = Label(root, text="Select a folder to scan for duplicates:")
         self.label.pack(pady=10)
@@ -60,6 +66,16 @@ class DuplicateImageFinder:
         self.select_button = Button(root, text="Select Folder", command=self.select_folder)
         self.select_button.pack(pady=5)
 
+        # Brings back the latest saved results without scanning; only files
+        # changed since are hashed again
+        self.open_button = Button(root, text="Open Previous Results", command=self.open_results)
+        self.open_button.pack(pady=5)
+
+        # Stops a running scan; scanning the same folder again resumes it
+        self.cancel_button = Button(root, text="Cancel Scan", command=self._cancel_scan)
+        self.cancel_button.pack(pady=5)
+        self.cancel_button.config(state='disabled')
+
         # Log checkbox
         self.log_var = BooleanVar(value=False)
         self.log_checkbox = Checkbutton(
@@ -69,6 +85,66 @@ class DuplicateImageFinder:
         )
         self.log_checkbox.pack(pady=5)
 
+        # Fast JPEG mode: hash the small EXIF thumbnail instead of the full image
+        self.thumb_var = BooleanVar(value=False)
+        self.thumb_checkbox = Checkbutton(
+            root,
+            text="Fast JPEG scan (hash EXIF thumbnails when present)",
+            variable=self.thumb_var
+        )
+        self.thumb_checkbox.pack(pady=5)
+
+        # Watch mode: keep the results up to date as files change after the scan
+        self.watch_var = BooleanVar(value=False)
+        self.watch_checkbox = Checkbutton(
+            root,
+            text="Keep watching the folder for changes after the scan",
+            variable=self.watch_var
+        )
+        self.watch_checkbox.pack(pady=5)
+        self.watching = False
+        self.live_groups = {}
+        self.group_rows = {}
+
+        # Number of processes used for hashing
+        workers_frame = Frame(root)
+        workers_frame.pack(pady=5)
+        Label(workers_frame, text="Worker processes:").pack(side="left")
+        self.workers_var = IntVar(value=default_workers())
+        self.workers_spinbox = Spinbox(
+            workers_frame,
+            from_=1,
+            to=max(64, default_workers()),
+            width=4,
+            textvariable=self.workers_var
+        )
+        self.workers_spinbox.pack(side="left", padx=5)
+
+        # Threads reading files ahead of the worker processes (0 = no read-ahead);
+        # raise it for network shares and spinning disks
+        Label(workers_frame, text="Read threads:").pack(side="left", padx=(10, 0))
+        self.io_workers_var = IntVar(value=DEFAULT_IO_WORKERS)
+        self.io_workers_spinbox = Spinbox(
+            workers_frame,
+            from_=0,
+            to=64,
+            width=4,
+            textvariable=self.io_workers_var
+        )
+        self.io_workers_spinbox.pack(side="left", padx=5)
+
+        # How many of the 64 hash bits may differ for two images to count as duplicates
+        Label(workers_frame, text="Match threshold (bits):").pack(side="left", padx=(10, 0))
+        self.threshold_var = IntVar(value=DEFAULT_THRESHOLD)
+        self.threshold_spinbox = Spinbox(
+            workers_frame,
+            from_=0,
+            to=MAX_THRESHOLD,
+            width=4,
+            textvariable=self.threshold_var
+        )
+        self.threshold_spinbox.pack(side="left", padx=5)
+
         # Listbox w/ scroll bars
         list_frame = Frame(self.root)
         list_frame.pack(expand=True, fill="both", padx=10, pady=10)
@@ -95,17 +171,25 @@ class DuplicateImageFinder:
         self.preview_button.pack(pady=5)
         self.preview_button.config(state='disabled')
 
-        # Trash handling w/ undo
-        self.trash_dir = os.path.join(os.getcwd(), ".trash")
-        os.makedirs(self.trash_dir, exist_ok=True)
-        self.last_deleted = []
+        # Timings of the last scan
+        self.scan_report = None
+        self.report_button = Button(root, text="Show Scan Report", command=self.show_scan_report)
+        self.report_button.pack(pady=5)
+        self.report_button.config(state='disabled')
+
+        # Trash handling w/ undo. Files on other drives go to a trash folder on
+        # their own drive; the journal keeps every delete undoable across restarts.
+        self.trash_dir = os.path.join(os.getcwd(), DEFAULT_TRASH_NAME)
+        self.trash = TrashManager(self.trash_dir)
+        self.trash_queue = queue.Queue()
+        self.trash_worker = None
         self.undo_button = Button(
             root,
             text="Undo Last Delete",
             command=self._undo_delete
         )
         self.undo_button.pack(pady=5)
-        self.undo_button.config(state="disabled")
+        self.undo_button.config(state="normal" if self.trash.undo_levels() else "disabled")
 
         # Trash handling w/ "empty trash" (permanent delete)
         self.empty_button = Button(
@@ -149,80 +233,245 @@ class DuplicateImageFinder:
 
         if folder_path:
             self.last_folder = folder_path
-            
-            self.select_button.config(state='disabled')
-            self.preview_button.config(state='disabled')
-            self.result_list.delete(0, END)
-            self.progress_label.config(text="Scanning... 0% complete")
-
-            self.deletion_vars.clear()
-            self.deletion_paths.clear()
-
-            # Start the worker thread
-            thread = threading.Thread(
-                target=self._scan_thread,
-                args=(folder_path,),
-                daemon=True
-            )
-            thread.start()
-
-            # Begin polling the queue every 100 ms
+            self._start_scan(folder_path)
+
+
+    def open_results(self):
+        self._start_scan(None, reopen=True)
+
+
+    def _start_scan(self, folder_path, reopen=False):
+        # Only one scan or watch at a time. The old one is cancelled but not
+        # waited for; whatever it still posts belongs to an older generation
+        # and is dropped by _process_scan_queue.
+        if self.scan_worker and self.scan_worker.is_alive():
+            self.scan_engine.cancel()
+            self.retired_workers.append(self.scan_worker)
+        self.retired_workers = [w for w in self.retired_workers if w.is_alive()]
+        self.scan_generation += 1
+
+        self.select_button.config(state='disabled')
+        self.open_button.config(state='disabled')
+        self.cancel_button.config(state='normal', text="Cancel Scan")
+        self.preview_button.config(state='disabled')
+        self.report_button.config(state='disabled')
+        self.result_list.delete(0, END)
+        if reopen:
+            self.progress_label.config(text="Opening previous results...")
+        else:
+            self.progress_label.config(text="Scanning... 0 files found")
+
+        self.deletion_vars.clear()
+        self.deletion_paths.clear()
+        self.live_groups.clear()
+        self.group_rows.clear()
+        self.scan_report = None
+        self.watching = self.watch_var.get()
+        self.revalidating = reopen
+
+        try:
+            workers = max(1, self.workers_var.get())
+        except Exception:
+            workers = default_workers()
+        try:
+            threshold = min(MAX_THRESHOLD, max(0, self.threshold_var.get()))
+        except Exception:
+            threshold = DEFAULT_THRESHOLD
+        try:
+            io_workers = max(0, self.io_workers_var.get())
+        except Exception:
+            io_workers = DEFAULT_IO_WORKERS
+
+        # Made here rather than in the worker, so a later scan can always cancel it
+        self.scan_engine = ScanEngine(
+            [folder_path] if folder_path else [],
+            workers=workers,
+            threshold=threshold,
+            use_exif_thumbnails=self.thumb_var.get(),
+            io_workers=io_workers
+        )
+
+        # Start the worker thread
+        self.scan_worker = threading.Thread(
+            target=self._scan_thread,
+            args=(self.scan_engine, self.scan_generation, self.watching, reopen, self.log_var.get()),
+            daemon=True
+        )
+        self.scan_worker.start()
+
+        # Begin polling the queue every 100 ms, unless a watch is still polling it
+        if not self.scan_polling:
+            self.scan_polling = True
             self.root.after(100, self._process_scan_queue)
 
 
-    def _scan_thread(self, folder_path):
-        # Gather all image paths
-        image_paths = []
-        for dirpath, _, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith(ALL_IMAGE_EXTS):
-                    image_paths.append(os.path.join(dirpath, file))
-        total = len(image_paths)
+    def _scan_thread(self, engine, generation, watch=False, reopen=False, log=False):
+        # The GUI is one consumer of the headless scan engine; forward the
+        # events it cares about to the Tk thread through scan_queue, tagged
+        # with this scan's generation.
+        # With reopen, the latest saved results are loaded instead of scanning.
+        def post(*msg):
+            self.scan_queue.put((generation,) + msg)
 
-        # If nothing to do, send done immediately
-        if total == 0:
-            self.scan_queue.put(('done', []))
-            return
+        if watch:
+            events = engine.watch(reopen=reopen)
+        else:
+            events = engine.reopen() if reopen else engine.scan()
 
-        hashes = {}
-        for idx, path in enumerate(image_paths, start=1):
-            filename = os.path.basename(path)
-            try:
-                img = Image.open(path)
-                h = imagehash.phash(img)
-                hashes.setdefault(h, []).append(path)
-            except Exception as e:
-                self.scan_queue.put(('error', filename, str(e)))
-            # Progress update
-            pct = int(idx/total*100)
-            self.scan_queue.put(('progress', pct))
+        # Optional log: group and group_update events as JSON lines, written
+        # as they arrive
+        log_file = os.path.join(os.getcwd(), 'duplicate_log.jsonl') if log else None
+        log_out = None
+        groups = {}
+        expected = None
 
-        # Retreive groups with more than one image
-        self.duplicate_groups = [grp for grp in hashes.values() if len(grp) > 1]
+        try:
+            for event in events:
+                kind = event['event']
+                if kind in ('group', 'group_update') and log_file:
+                    try:
+                        if log_out is None:
+                            log_out = open(log_file, 'w', encoding='utf-8')
+                            post('log', log_file)
+                        log_out.write(json.dumps(event) + "\n")
+                        log_out.flush()
+                    except OSError as e:
+                        post('log_error', str(e))
+                        log_file = None
+
+                if kind == 'progress':
+                    post('progress', event['hashed'], event['found'], event['walk_done'])
+                elif kind == 'error':
+                    post('error', os.path.basename(event['path']), event['error'])
+                elif kind == 'resumed':
+                    post('resumed', event['files'])
+                elif kind == 'reopened':
+                    post('reopened', event['roots'], event['finished'], event['files'])
+                    expected = event['groups']
+                elif kind == 'cancelled':
+                    post('cancelled', event['hashed'], event['files'])
+                    return
+                elif kind == 'group':
+                    groups[event['group']] = (event['paths'], event['match'])
+                elif kind == 'done' and not reopen:
+                    # Scanning done, send duplicates list
+                    post('done', groups, engine.stats.report())
+                elif kind == 'revalidated':
+                    post('revalidated', event['changed'], event['removed'])
+                elif kind == 'group_update':
+                    post('group_update', event['group'], event['match'], event['paths'])
+
+                # Saved groups show up as soon as they are loaded, before the
+                # files are checked for changes
+                if expected is not None and len(groups) == expected:
+                    post('done', groups, None)
+                    expected = None
+        except ValueError as e:
+            # Nothing saved to reopen
+            post('failed', str(e))
+            return
+        except Exception as e:
+            # Anything else would end the thread silently and leave the
+            # buttons disabled
+            post('failed', f"Scan failed: {e}")
+            return
+        finally:
+            if log_out is not None:
+                log_out.close()
 
-        # Scanning done, send duplicates list
-        self.scan_queue.put(('done', self.duplicate_groups))
+        if watch:
+            post('watch_stopped')
 
 
     def _process_scan_queue(self):
         try:
             while True:
-                msg = self.scan_queue.get_nowait()
+                generation, *msg = self.scan_queue.get_nowait()
+                if generation != self.scan_generation:
+                    # Left over from a scan that has since been replaced
+                    continue
                 tag = msg[0]
 
                 if tag == 'progress':
-                    _, pct = msg
-                    self.progress_label.config(text=f"Scanning... {pct}% complete")
+                    _, hashed, found, walk_done = msg
+                    if walk_done and found:
+                        pct = int(hashed/found*100)
+                        text = f"Scanning... {pct}% complete ({hashed:,} of {found:,} files)"
+                    else:
+                        text = f"Scanning... {found:,} files found, {hashed:,} hashed"
+                    self.progress_label.config(text=text)
 
                 elif tag == 'error':
                     _, filename, error = msg
                     self.result_list.insert(END, f"Error: {filename} ({error})")
 
+                elif tag == 'resumed':
+                    self.result_list.insert(
+                        END, f"Resuming interrupted scan ({msg[1]:,} files already found)"
+                    )
+
+                elif tag == 'reopened':
+                    _, roots, finished, files = msg
+                    when = time.strftime("%Y-%m-%d %H:%M", time.localtime(finished))
+                    self.result_list.insert(END, f"Results of {', '.join(roots)} scanned {when}")
+                    self.progress_label.config(text=f"Checking {files:,} files for changes...")
+
+                elif tag == 'log':
+                    self.result_list.insert(END, f"Log file created at {msg[1]}")
+
+                elif tag == 'log_error':
+                    self.result_list.insert(END, f"Error writing log file: {msg[1]}")
+
+                elif tag == 'failed':
+                    self.progress_label.config(text=msg[1])
+                    self.select_button.config(state='normal')
+                    self.open_button.config(state='normal')
+                    self.cancel_button.config(state='disabled')
+                    self.scan_polling = False
+                    return
+
+                elif tag == 'cancelled':
+                    _, hashed, found = msg
+                    self.progress_label.config(
+                        text=f"Scan cancelled after {hashed:,} of {found:,} files. "
+                             "Scan the folder again to resume."
+                    )
+                    self.select_button.config(state='normal')
+                    self.open_button.config(state='normal')
+                    self.cancel_button.config(state='disabled')
+                    self.scan_polling = False
+                    return
+
                 elif tag == 'done':
-                    _, duplicates = msg
                     # Hand off to completion handler
-                    self._on_scan_complete(duplicates)
-                    return  # stop processing after 'done'
+                    self.scan_report = msg[2]
+                    self._on_scan_complete(msg[1])
+                    if not (self.watching or self.revalidating):
+                        self.scan_polling = False
+                        return  # stop processing after 'done'
+
+                elif tag == 'revalidated':
+                    _, changed, removed = msg
+                    self.revalidating = False
+                    text = f"Results reopened: {changed:,} changed and {removed:,} missing files since the scan."
+                    if self.watching:
+                        text += " Watching for changes..."
+                    self.progress_label.config(text=text)
+                    if not self.watching:
+                        self.cancel_button.config(state='disabled')
+                        self.scan_polling = False
+                        return
+
+                elif tag == 'group_update':
+                    _, gid, match, paths = msg
+                    self._on_group_update(gid, match, paths)
+
+                elif tag == 'watch_stopped':
+                    self.progress_label.config(text="Stopped watching.")
+                    self.cancel_button.config(state='disabled', text="Cancel Scan")
+                    self.watching = False
+                    self.scan_polling = False
+                    return
         except queue.Empty:
             # No more messages right now
             pass
@@ -231,35 +480,106 @@ class DuplicateImageFinder:
         self.root.after(100, self._process_scan_queue)
 
 
+    def _cancel_scan(self):
+        if self.scan_engine:
+            self.scan_engine.cancel()
+            self.cancel_button.config(state='disabled', text="Cancel Scan")
+            self.progress_label.config(text="Cancelling scan...")
+
+
+    def _on_group_update(self, gid, match, paths):
+        # Watch mode: rewrite the group's row in place, or add a row for a new group
+        if paths:
+            self.live_groups[gid] = (paths, match)
+            text = f"Duplicate Group ({match}):\n  " + "\n  ".join(paths) + "\n"
+        else:
+            self.live_groups.pop(gid, None)
+            text = "Duplicate Group resolved (no duplicates left)"
+
+        row = self.group_rows.get(gid)
+        if row is not None:
+            self.result_list.delete(row)
+            self.result_list.insert(row, text)
+        elif paths:
+            self.group_rows[gid] = self.result_list.size()
+            self.result_list.insert(END, text)
+            self.result_list.see(END)
+
+        self._update_groups()
+
+
+    def _update_groups(self):
+        live = [self.live_groups[g] for g in sorted(self.live_groups)]
+        self.duplicate_groups = [grp for grp, _ in live]
+        self.group_matches = [match for _, match in live]
+        self.preview_button.config(state='normal' if self.duplicate_groups else 'disabled')
+
+
+    def _on_close(self):
+        # Let a running scan write its checkpoint, and a trash operation
+        # finish, before the process exits
+        if self.trash_worker and self.trash_worker.is_alive():
+            self.root.after(100, self._on_close)
+            return
+        if self.scan_worker and self.scan_worker.is_alive():
+            if self.scan_engine:
+                self.scan_engine.cancel()
+            self.progress_label.config(text="Saving scan checkpoint...")
+            self.root.after(100, self._on_close)
+            return
+        # Scans replaced by a newer one were already cancelled
+        if any(w.is_alive() for w in self.retired_workers):
+            self.root.after(100, self._on_close)
+            return
+        self.root.destroy()
+
+
     def _on_scan_complete(self, groups):
-        self.progress_label.config(text="Scan complete.")
+        # groups maps group id -> (paths, match), as numbered in the engine's events
         self.select_button.config(state='normal')
-
-        # Optional log
-        if groups and self.log_var.get():
-            log_file = os.path.join(os.getcwd(), 'duplicate_log.txt')
-            try:
-                with open(log_file, 'w') as f:
-                    f.write('Duplicate groups:\n')
-                    for grp in groups:
-                        f.write(", ".join(grp) + "\n")
-                self.result_list.insert(END, f"Log file created at {log_file}")
-            except Exception as e:
-                self.result_list.insert(END, f"Error writing log file: {e}")
+        self.open_button.config(state='normal')
+        self.report_button.config(state='normal' if self.scan_report else 'disabled')
+        if self.watching:
+            self.cancel_button.config(text="Stop Watching")
+        elif not self.revalidating:
+            self.cancel_button.config(state='disabled')
+        # Reopened results keep the "Checking..." status until revalidated
+        if not self.revalidating:
+            if self.watching:
+                self.progress_label.config(text="Scan complete. Watching for changes...")
+            else:
+                self.progress_label.config(text="Scan complete.")
+        self.live_groups = dict(groups)
+        self._update_groups()
 
         # Show results & enable preview if needed
         if groups:
-            for grp in groups:
-                # Show first two paths in the preview list
+            for gid in sorted(groups):
+                grp, match = groups[gid]
+                self.group_rows[gid] = self.result_list.size()
                 self.result_list.insert(
                     END,
-                    "Duplicate Group:\n  " + "\n  ".join(grp) + "\n"
+                    f"Duplicate Group ({match}):\n  " + "\n  ".join(grp) + "\n"
                 )
-            self.preview_button.config(state='normal')
         else:
             self.result_list.insert(END, "No duplicates found.")
 
 
+    def show_scan_report(self):
+        if not self.scan_report:
+            return
+
+        window = Toplevel(self.root)
+        window.title("Scan Report")
+        text = Text(window, width=90, height=40, wrap="none", font=("Courier", 10))
+        v_scroll = Scrollbar(window, orient="vertical", command=text.yview)
+        text.config(yscrollcommand=v_scroll.set)
+        v_scroll.pack(side="right", fill="y")
+        text.pack(side="left", fill="both", expand=True)
+        text.insert(END, format_report(self.scan_report))
+        text.config(state='disabled')
+
+
     def show_preview_window(self):
         if not self.duplicate_groups:
             return
@@ -280,72 +600,180 @@ class DuplicateImageFinder:
         v_scroll.pack(side="right", fill="y")
         h_scroll = Scrollbar(preview, orient="horizontal", command=canvas.xview)
         h_scroll.pack(side="bottom", fill="x")
-        canvas.configure(yscrollcommand=v_scroll.set, xscrollcommand=h_scroll.set)
-
-        # This frame will hold all of the pair-frames
-        inner = Frame(canvas)
-        canvas.create_window((0, 0), window=inner, anchor="nw")
 
-        # Whenever inner changes size, update scrollable region
-        def on_inner_config(evt):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-        inner.bind("<Configure>", on_inner_config)
+        groups = self.duplicate_groups
 
-        # Reset deletion tracking
+        # Reset deletion tracking. Every duplicate gets its checkbox variable up
+        # front, so Select All and Delete Selected cover groups never scrolled to.
         self.deletion_vars.clear()
         self.deletion_paths.clear()
+        group_vars = []
+        for group in groups:
+            # First image is protected: it gets no variable
+            variables = [None]
+            for path in group[1:]:
+                var = BooleanVar(value=False)
+                self.deletion_vars.append(var)
+                self.deletion_paths.append(path)
+                variables.append(var)
+            group_vars.append(variables)
+
+        # Group frames are only built for the rows inside the viewport; rows are
+        # a fixed height so the visible range follows from the scroll offset
+        group_widths = [len(group) * PREVIEW_CELL_W + PREVIEW_GROUP_PAD for group in groups]
+        rows = []
+        built = {}
+
+        # Thumbnails are decoded on a background pool (through the on-disk
+        # cache) and turned into PhotoImages here on the Tk thread
+        thumbs = ThumbnailCache()
+        pool = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS)
+        loaded = queue.Queue()
+        photos = OrderedDict()
+        waiting = {}
+        futures = {}
+        placeholder = PhotoImage(width=PREVIEW_THUMB_SIZE, height=PREVIEW_THUMB_SIZE)
+
+        def load_thumbnail(path):
+            # Runs on the pool
+            try:
+                img = thumbs.load(path, (PREVIEW_THUMB_SIZE, PREVIEW_THUMB_SIZE))
+                loaded.put((path, img))
+            except Exception:
+                loaded.put((path, None))
 
-        # Build each pair frame (but don’t grid yet)
-        pair_frames = []
-        for group in self.duplicate_groups:
-            pf = Frame(inner, relief="groove", borderwidth=2, padx=5, pady=5)
-
-            for idx, path in enumerate(group):
-                # Load and thumbnail the image
-                img = Image.open(path)
-                img.thumbnail((100, 100))
-                photo = ImageTk.PhotoImage(img)
-
-                # Place the image
-                lbl = Label(pf, image=photo)
+        def show(path, lbl):
+            photo = photos.get(path)
+            if photo is not None:
+                photos.move_to_end(path)
+                lbl.config(image=photo)
                 lbl.image = photo  # keep a reference!
-                lbl.grid(row=0, column=idx, padx=5, pady=5)
+                return
+            waiting.setdefault(path, []).append(lbl)
+            if path not in futures:
+                futures[path] = pool.submit(load_thumbnail, path)
 
-                # First image is protected: disabled checkbox
-                if idx == 0:
-                    cb = Checkbutton(pf, state='disabled')
-                    cb.grid(row=1, column=idx, pady=(0, 5))
-                else:
-                    # True duplicates get a real checkbox
-                    var = BooleanVar(value=False)
-                    cb = Checkbutton(pf, variable=var)
+        def poll_thumbnails():
+            if not preview.winfo_exists():
+                return
+            try:
+                while True:
+                    path, img = loaded.get_nowait()
+                    futures.pop(path, None)
+                    labels = [lbl for lbl in waiting.pop(path, []) if lbl.winfo_exists()]
+                    if img is None:
+                        for lbl in labels:
+                            lbl.config(text="No preview", compound="center")
+                        continue
+
+                    photo = ImageTk.PhotoImage(img)
+                    photos[path] = photo
+                    if len(photos) > PREVIEW_MAX_PHOTOS:
+                        photos.popitem(last=False)
+                    for lbl in labels:
+                        lbl.config(image=photo)
+                        lbl.image = photo  # keep a reference!
+            except queue.Empty:
+                pass
+            preview.after(50, poll_thumbnails)
+
+        def build_row(r):
+            x = 0
+            items = []
+            for gi in rows[r]:
+                pf = Frame(canvas, relief="groove", borderwidth=2, padx=5, pady=5)
+                for idx, path in enumerate(groups[gi]):
+                    # Place the image
+                    lbl = Label(pf, image=placeholder)
+                    lbl.grid(row=0, column=idx, padx=5, pady=5)
+                    show(path, lbl)
+
+                    if idx == 0:
+                        # First image is protected: disabled checkbox
+                        cb = Checkbutton(pf, state='disabled')
+                    else:
+                        # True duplicates get a real checkbox
+                        cb = Checkbutton(pf, variable=group_vars[gi][idx])
                     cb.grid(row=1, column=idx, pady=(0, 5))
 
-                    # Track for deletion
-                    self.deletion_vars.append(var)
-                    self.deletion_paths.append(path)
-
-            pair_frames.append(pf)
+                window = canvas.create_window(x + 10, r * PREVIEW_ROW_H + 10, window=pf, anchor="nw")
+                items.append((window, pf, groups[gi]))
+                x += group_widths[gi]
+            built[r] = items
+
+        def drop_row(r):
+            for window, pf, group in built.pop(r):
+                canvas.delete(window)
+                pf.destroy()
+                # Don't decode thumbnails nobody is waiting for any more
+                for path in group:
+                    labels = [lbl for lbl in waiting.get(path, []) if lbl.winfo_exists()]
+                    if labels:
+                        waiting[path] = labels
+                    else:
+                        waiting.pop(path, None)
+                        future = futures.get(path)
+                        if future is not None and future.cancel():
+                            del futures[path]
+
+        def refresh():
+            # Build the rows in (or just around) the viewport, destroy the rest
+            top = canvas.canvasy(0)
+            bottom = top + canvas.winfo_height()
+            first = max(0, int(top // PREVIEW_ROW_H) - 1)
+            last = min(len(rows), int(bottom // PREVIEW_ROW_H) + 2)
+            for r in list(built):
+                if r < first or r >= last:
+                    drop_row(r)
+            for r in range(first, last):
+                if r not in built:
+                    build_row(r)
 
         # Dynamic reflow logic
         def reflow(event=None):
-            width = canvas.winfo_width()
-            if not pair_frames:
+            width = max(canvas.winfo_width(), 1)
+            if rows and event is not None and event.width == reflow.width:
+                refresh()
                 return
-            frame_w = pair_frames[0].winfo_reqwidth() + 20
-            # Calculate how many columns fit
-            cols = max(1, width // frame_w)
-            # Re-grid each frame into the new layout
-            for i, pf in enumerate(pair_frames):
-                r, c = divmod(i, cols)
-                pf.grid(row=r, column=c, padx=10, pady=10, sticky="n")
+            reflow.width = width
+
+            # Pack groups into rows that fit the canvas width
+            rows.clear()
+            row, used = [], 0
+            for gi, group_w in enumerate(group_widths):
+                if row and used + group_w > width:
+                    rows.append(row)
+                    row, used = [], 0
+                row.append(gi)
+                used += group_w
+            if row:
+                rows.append(row)
+
+            for r in list(built):
+                drop_row(r)
             # Update scroll region
-            canvas.configure(scrollregion=canvas.bbox("all"))
+            canvas.configure(scrollregion=(
+                0, 0, max(width, max(group_widths)), len(rows) * PREVIEW_ROW_H
+            ))
+            refresh()
+        reflow.width = None
+
+        def on_yscroll(first, last):
+            v_scroll.set(first, last)
+            refresh()
+
+        def on_close():
+            pool.shutdown(wait=False, cancel_futures=True)
+            preview.destroy()
+
+        canvas.configure(yscrollcommand=on_yscroll, xscrollcommand=h_scroll.set)
+        preview.protocol("WM_DELETE_WINDOW", on_close)
 
         # Bind reflow on initial draw and on canvas resize
         canvas.bind("<Configure>", reflow)
         preview.update_idletasks()
         reflow()
+        poll_thumbnails()
 
 
     def _select_all(self):
@@ -379,69 +807,94 @@ class DuplicateImageFinder:
             self.result_list.insert(END, "Deletion cancelled.")
             return
 
-        # Reset any previous undo history
-        self.last_deleted.clear()
+        self._run_trash_job(
+            "Moving to trash",
+            lambda progress: self.trash.trash(to_trash, progress),
+            self._on_trash_done
+        )
 
-        # Move each file into .trash
-        for orig_path in to_trash:
-            try:
-                filename = os.path.basename(orig_path)
-                trash_path = os.path.join(self.trash_dir, filename)
-
-                # If a file with the same name already exists in .trash, add a numeric suffix to avoid overwriting
-                base, ext = os.path.splitext(filename)
-                counter = 1
-                while os.path.exists(trash_path):
-                    trash_path = os.path.join(
-                        self.trash_dir,
-                        f"{base}_{counter}{ext}"
-                    )
-                    counter += 1
 
-                shutil.move(orig_path, trash_path)
+    def _run_trash_job(self, verb, job, on_done):
+        # Bulk trash operations run on a worker thread; progress and the result
+        # come back through trash_queue, like the scan's messages
+        if self.trash_worker and self.trash_worker.is_alive():
+            messagebox.showinfo("Busy", "Please wait for the current trash operation to finish.")
+            return
+        self.undo_button.config(state="disabled")
+        self.empty_button.config(state="disabled")
+        self.progress_label.config(text=f"{verb}...")
+
+        def progress(done, total):
+            if done == total or done % 100 == 0:
+                self.trash_queue.put(('progress', done, total))
 
-                # Record the pair so we can undo
-                self.last_deleted.append((orig_path, trash_path))
+        def worker():
+            try:
+                self.trash_queue.put(('done', job(progress)))
             except Exception as e:
-                self.result_list.insert(
-                    END,
-                    f"Error moving {orig_path} to trash: {e}"
-                )
+                self.trash_queue.put(('failed', e))
+
+        self.trash_worker = threading.Thread(target=worker, daemon=True)
+        self.trash_worker.start()
+        self.root.after(100, self._process_trash_queue, verb, on_done)
+
+
+    def _process_trash_queue(self, verb, on_done):
+        try:
+            while True:
+                msg = self.trash_queue.get_nowait()
+                if msg[0] == 'progress':
+                    _, done, total = msg
+                    self.progress_label.config(text=f"{verb}... {done:,} of {total:,} files")
+                    continue
+
+                if msg[0] == 'done':
+                    on_done(*msg[1])
+                else:
+                    self.result_list.insert(END, f"Error: {msg[1]}")
+                self.progress_label.config(text="")
+                self.undo_button.config(state="normal" if self.trash.undo_levels() else "disabled")
+                self.empty_button.config(state="normal")
+                return
+        except queue.Empty:
+            pass
+        self.root.after(100, self._process_trash_queue, verb, on_done)
 
-        # Report what was trashed in the main Listbox
-        for orig, _ in self.last_deleted:
-            self.result_list.insert(END, f"Moved to trash: {orig}")
 
-        # Enable the "Undo" button now that there is something to undo
-        if self.last_deleted:
-            self.undo_button.config(state="normal")
+    def _report_errors(self, verb, errors):
+        self.result_list.insert(END, *[f"Error {verb} {path}: {error}" for path, error in errors])
+
+
+    def _on_trash_done(self, moved, errors):
+        # Report what was trashed in the main Listbox, in one insert for big batches
+        if moved:
+            self.result_list.insert(END, *[f"Moved to trash: {orig}" for orig, _ in moved])
+        if errors:
+            self._report_errors("moving to trash", errors)
 
 
     def _undo_delete(self):
-        for orig_path, trash_path in self.last_deleted:
-            try:
-                shutil.move(trash_path, orig_path)
-                self.result_list.insert(END, f"Restored: {orig_path}")
-            except Exception as e:
-                self.result_list.insert(
-                    END,
-                    f"Error restoring {orig_path}: {e}"
-                )
+        self._run_trash_job("Restoring", self.trash.undo, self._on_undo_done)
 
-        # Clear the record so it isn't restored twice and disable the button until the next delete
-        self.last_deleted.clear()
-        self.undo_button.config(state="disabled")
+
+    def _on_undo_done(self, restored, errors):
+        if restored:
+            self.result_list.insert(END, *[f"Restored: {orig}" for orig, _ in restored])
+        if errors:
+            self._report_errors("restoring", errors)
+        levels = self.trash.undo_levels()
+        if levels:
+            self.result_list.insert(END, f"{levels} earlier delete{'s' if levels > 1 else ''} can still be undone.")
 
 
     def _empty_trash(self):
-        # List everything currently in the trash folder
-        trashed_files = os.listdir(self.trash_dir)
+        # Count everything currently in the trash folders
+        count = self.trash.count()
 
-        if not trashed_files:
+        if not count:
             messagebox.showinfo("Empty Trash", "Trash is already empty.")
             return
 
-        count = len(trashed_files)
         confirm = messagebox.askyesno(
             "Confirm Empty Trash",
             f"Are you sure you want to permanently delete {count} "
@@ -452,26 +905,22 @@ class DuplicateImageFinder:
             self.result_list.insert(END, "Empty Trash cancelled.")
             return
 
-        try:
-            # Remove the entire trash directory
-            shutil.rmtree(self.trash_dir)
-            # Recreate an empty trash directory
-            os.makedirs(self.trash_dir, exist_ok=True)
-
-            # Clear any undo history and disable “Undo”
-            self.last_deleted.clear()
-            self.undo_button.config(state="disabled")
-
-            # Report success in the main Listbox
-            self.result_list.insert(
-                END,
-                f"Emptied trash: {count} file{'s' if count > 1 else ''} permanently deleted."
-            )
-        except Exception as e:
-            self.result_list.insert(END, f"Error emptying trash: {e}")
+        self._run_trash_job("Emptying trash", self.trash.empty, self._on_empty_done)
+
+
+    def _on_empty_done(self, deleted, errors):
+        # Report success in the main Listbox
+        self.result_list.insert(
+            END,
+            f"Emptied trash: {deleted} file{'s' if deleted != 1 else ''} permanently deleted."
+        )
+        if errors:
+            self._report_errors("deleting", errors)
 
 
 if __name__ == "__main__":
+    # Needed for the hashing process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     root = Tk()
     app = DuplicateImageFinder(root)
     root.mainloop()